@@ -0,0 +1,394 @@
+"""
+End-to-end benchmark of the render pipeline on synthetic scripts.
+
+Each scenario generates a script (long blocks, join raids, emoji-heavy lines,
+many sound cues, ...) and runs it through every stage – validate_script_lines,
+compile_script, save_images, gen_vid (the encode) and add_sounds – timing them
+one by one and end to end, with frames/sec, bytes written and the peak RSS
+of the process so far (getrusage only knows the lifetime peak, so a stage
+reports the largest of itself and every stage before it).
+
+    python benchmarks/benchmark.py                          # all scenarios, results/…json
+    python benchmarks/benchmark.py -s raid -s long_blocks --repeat 5 --preset draft
+    python benchmarks/benchmark.py --save-baseline benchmarks/baseline.json
+    python benchmarks/benchmark.py --baseline benchmarks/baseline.json --threshold 0.10
+    python benchmarks/benchmark.py --print-script raid      # just the synthetic script
+
+With ``--baseline``, every stage slower than the baseline by more than the
+threshold is reported and the exit status is 1. Baselines only make sense on
+the machine (and with the options) they were recorded with.
+"""
+import sys
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR / "scripts"))
+
+import PIL  # noqa: E402
+
+import compile_images  # noqa: E402
+from audio_engine import DEFAULT_ENGINE, ENGINES  # noqa: E402
+from characters import get_characters  # noqa: E402
+from compile_images import encode_video  # noqa: E402
+from generate_chat import save_images  # noqa: E402
+from presets import DEFAULT_PRESET, PRESETS, get_preset  # noqa: E402
+from script_compiler import compile_script  # noqa: E402
+from script_validator import validate_script_lines  # noqa: E402
+from sound_effects import add_sounds  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_DIR = REPO_DIR / "benchmarks" / "results"
+SOUNDS_DIR = REPO_DIR / "assets" / "sounds" / "mp3"
+EXAMPLE_SCRIPT = REPO_DIR / "assets" / "example" / "example_script.txt"
+
+STAGES = ("validate", "compile", "save_images", "gen_vid", "add_sounds")
+# Stages faster than this (in the baseline) are too noisy to flag as regressions
+MIN_COMPARE_SECONDS = 0.05
+DEFAULT_THRESHOLD = 0.10
+
+WORDS = ("bruh", "who", "invited", "this", "guy", "hello", "server", "why", "am", "I", "here", "pizza",
+         "western", "dogs", "still", "loading", "group", "happening", "what", "is", "lunch", "now")
+EMOJIS = ("💀", "😂", "🔥", "👀", "🤔", "🍕", "😭", "🙏")
+
+
+class Scenario(NamedTuple):
+    """Shape of a synthetic script."""
+    blocks: int = 12            # speaker blocks
+    block_length: int = 3       # messages per block
+    joins: int = 4              # WELCOME lines in total
+    join_run: int = 1           # WELCOME lines in a row
+    emoji_ratio: float = 0.15   # share of emoji-only messages
+    sound_ratio: float = 0.3    # share of messages with a sound cue
+    duration: float = 1.0       # seconds per message
+
+
+SCENARIOS = {
+    "mixed": Scenario(),
+    "long_blocks": Scenario(blocks=3, block_length=40, joins=0),
+    "raid": Scenario(blocks=2, block_length=3, joins=60, join_run=30, duration=0.5),
+    "emoji": Scenario(blocks=10, block_length=4, emoji_ratio=0.8),
+    "sounds": Scenario(blocks=10, block_length=5, sound_ratio=1.0, duration=0.5),
+}
+
+
+def synthetic_script(scenario, scale=1.0, seed=0):
+    """Lines of a script shaped like ``scenario``; ``scale`` multiplies the blocks and joins."""
+    rng = random.Random(seed)
+    names = sorted(get_characters())
+    sounds = sorted(path.stem for path in SOUNDS_DIR.glob("*.mp3"))
+    blocks = max(1, round(scenario.blocks * scale))
+    joins = round(scenario.joins * scale)
+    runs = -(-joins // scenario.join_run) if joins else 0
+    join_every = max(1, blocks // runs) if runs else None
+
+    def cue():
+        return f"#!{rng.choice(sounds)}" if sounds and rng.random() < scenario.sound_ratio else ""
+
+    def message():
+        if rng.random() < scenario.emoji_ratio:
+            return "".join(rng.choice(EMOJIS) for _ in range(rng.randint(1, 3)))
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 12))]
+        style = rng.random()
+        if style < 0.1:
+            words[0] = f"**{words[0]}**"
+        elif style < 0.2:
+            words[-1] = f"__{words[-1]}__"
+        elif style < 0.3:
+            words.insert(0, f"@{rng.choice(names)}")
+        return " ".join(words)
+
+    lines = []
+    for block in range(blocks):
+        if joins and join_every and block % join_every == 0:
+            for _ in range(min(scenario.join_run, joins)):
+                lines.append(f"WELCOME {rng.choice(names)}$^{scenario.duration}{cue()}")
+                joins -= 1
+            lines.append("")
+        lines.append(f"{rng.choice(names)}:")
+        for _ in range(scenario.block_length):
+            lines.append(f"{message()}$^{scenario.duration}{cue()}")
+        lines.append("")
+    while joins > 0:
+        lines.append(f"WELCOME {rng.choice(names)}$^{scenario.duration}{cue()}")
+        joins -= 1
+    return lines
+
+
+# ----------------------------------------------------------------------
+# Measurements
+# ----------------------------------------------------------------------
+def _peak_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _tree_size(path):
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    if not path.is_dir():
+        return 0
+    return sum(entry.stat().st_size for entry in path.rglob("*") if entry.is_file())
+
+
+class Stage(NamedTuple):
+    seconds: float
+    bytes_written: int
+    cumulative_peak_rss_mb: float           # this process, from its start to the end of the stage
+    cumulative_children_peak_rss_mb: float  # largest child finished so far (ffmpeg, frame workers)
+
+
+def _run_stage(function, outputs=()):
+    before = sum(_tree_size(path) for path in outputs)
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    written = sum(_tree_size(path) for path in outputs) - before
+    rusage = resource.RUSAGE_SELF if resource else None
+    children = resource.RUSAGE_CHILDREN if resource else None
+    return result, Stage(seconds, max(0, written), _peak_rss_mb(rusage), _peak_rss_mb(children))
+
+
+def run_pipeline(lines, work_dir, options):
+    """Runs every stage once in ``work_dir``; returns (frame count, {stage: Stage})."""
+    work_dir = Path(work_dir)
+    chat_dir = work_dir / "chat"
+    output = work_dir / "final.mp4"
+    preset = options["preset"]
+    stages = {}
+
+    errors, stages["validate"] = _run_stage(lambda: validate_script_lines(lines))
+    if errors:
+        raise ValueError("Synthetic script does not validate:\n" + "\n".join(errors))
+    timeline, stages["compile"] = _run_stage(lambda: compile_script(lines))
+    _, stages["save_images"] = _run_stage(
+        lambda: save_images(lines, datetime.datetime(2024, 1, 1, 13, 5), timeline=timeline,
+                            workers=options["workers"], seed=1, chat_dir=chat_dir, size=preset.size),
+        outputs=[chat_dir],
+    )
+    _, stages["gen_vid"] = _run_stage(
+        lambda: encode_video(timeline, chat_dir, work_dir, segmented=options["segmented"], preset=preset),
+        outputs=[work_dir / "output.mp4", compile_images.SEGMENT_CACHE_DIR],
+    )
+    _, stages["add_sounds"] = _run_stage(
+        lambda: add_sounds("<benchmark>", timeline=timeline, engine=options["audio_engine"], work_dir=work_dir,
+                           output_path=output),
+        outputs=[output],
+    )
+    return len(timeline.frames), stages
+
+
+def benchmark(name, lines, options, repeat=3, verbose=False):
+    """Runs the pipeline ``repeat`` times on ``lines``; keeps the best time of every stage."""
+    runs = []
+    frames = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix=f"beluga-bench-{name}-") as tmp_dir:
+            # Fresh segment cache every run, so --segmented measures real encodes
+            compile_images.SEGMENT_CACHE_DIR = Path(tmp_dir) / "segments"
+            quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                frames, stages = run_pipeline(lines, tmp_dir, options)
+        runs.append(stages)
+
+    result = {"frames": frames, "lines": len(lines), "stages": {}}
+    for stage in STAGES:
+        samples = [run[stage] for run in runs]
+        best = min(samples, key=lambda sample: sample.seconds)
+        result["stages"][stage] = {
+            "seconds": round(best.seconds, 4),
+            "median_seconds": round(statistics.median(sample.seconds for sample in samples), 4),
+            "bytes_written": best.bytes_written,
+            "cumulative_peak_rss_mb": max(
+                (s.cumulative_peak_rss_mb for s in samples if s.cumulative_peak_rss_mb is not None), default=None),
+            "cumulative_children_peak_rss_mb": max(
+                (s.cumulative_children_peak_rss_mb for s in samples
+                 if s.cumulative_children_peak_rss_mb is not None), default=None),
+        }
+    totals = [sum(run[stage].seconds for stage in STAGES) for run in runs]
+    result["total_seconds"] = round(min(totals), 4)
+    result["median_total_seconds"] = round(statistics.median(totals), 4)
+    result["frames_per_second"] = round(frames / result["stages"]["save_images"]["seconds"], 2)
+    result["bytes_written"] = sum(stage["bytes_written"] for stage in result["stages"].values())
+    return result
+
+
+def environment():
+    """Machine and software the results were measured on."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        ffmpeg = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    except OSError:
+        ffmpeg = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "ffmpeg": ffmpeg,
+    }
+
+
+# ----------------------------------------------------------------------
+# Baseline comparison
+# ----------------------------------------------------------------------
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares the stage times of ``results`` with ``baseline`` (both as written
+    by this script). Returns one (scenario, stage, baseline s, new s, ratio)
+    tuple per stage that got slower by more than ``threshold``.
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        timings = [(stage, base["stages"][stage]["seconds"], result["stages"][stage]["seconds"])
+                   for stage in STAGES if stage in base.get("stages", {})]
+        timings.append(("total", base["total_seconds"], result["total_seconds"]))
+        for stage, old, new in timings:
+            if old < MIN_COMPARE_SECONDS:
+                continue
+            ratio = new / old
+            if ratio > 1 + threshold:
+                regressions.append((name, stage, old, new, ratio))
+    return regressions
+
+
+def print_report(results, baseline=None):
+    header = (f"{'scenario':<12} {'stage':<12} {'seconds':>9} {'baseline':>9} {'change':>8} {'MB written':>11} "
+              f"{'cum. peak RSS':>14}")
+    print(header)
+    print("-" * len(header))
+    for name, result in results["scenarios"].items():
+        base = (baseline or {}).get("scenarios", {}).get(name)
+        rows = [(stage, result["stages"][stage]) for stage in STAGES]
+        rows.append(("total", {"seconds": result["total_seconds"], "bytes_written": result["bytes_written"],
+                               "cumulative_peak_rss_mb": None}))
+        for stage, values in rows:
+            old = None
+            if base is not None:
+                old = base["total_seconds"] if stage == "total" else base["stages"].get(stage, {}).get("seconds")
+            change = f"{(values['seconds'] / old - 1):+.0%}" if old else ""
+            peak = values.get("cumulative_peak_rss_mb")
+            rss = f"{peak:.0f} MB" if peak is not None else ""
+            old_text = f"{old:.3f}" if old is not None else ""
+            print(f"{name:<12} {stage:<12} {values['seconds']:>9.3f} {old_text:>9} "
+                  f"{change:>8} {values['bytes_written'] / 1e6:>11.2f} {rss:>14}")
+        print(f"{name:<12} {result['frames']} frames, {result['frames_per_second']} frames/s rendered")
+        print()
+
+
+# ----------------------------------------------------------------------
+def recorded_options(args, preset):
+    """
+    The options of a run as its results file records them. They go through
+    JSON here, so they compare equal to those of a baseline read back from
+    disk (the preset size, for one, is a tuple here and a list there).
+    """
+    options = {"workers": args.workers, "preset": preset._asdict(), "segmented": args.segmented,
+               "audio_engine": args.audio_engine, "scale": args.scale, "repeat": args.repeat}
+    return json.loads(json.dumps(options))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark the render pipeline.")
+    parser.add_argument("-s", "--scenario", action="append", choices=[*SCENARIOS, "example"],
+                        help="Scenario to run (repeatable; default: all synthetic ones).")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the blocks and joins of every scenario.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the best time counts (default: 3).")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Frame rendering processes (default: 1).")
+    parser.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET)
+    parser.add_argument("--vfr", action="store_true", help="Encode with a variable frame rate (not with --segmented).")
+    parser.add_argument("--segmented", action="store_true", help="Encode in segments.")
+    parser.add_argument("--audio-engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE)
+    parser.add_argument("-o", "--output", help="Where to write the results (default: benchmarks/results/).")
+    parser.add_argument("--baseline", help="Compare with the results in this file.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Slowdown counted as a regression, as a fraction (default: {DEFAULT_THRESHOLD}).")
+    parser.add_argument("--save-baseline", help="Also write the results to this file, as the new baseline.")
+    parser.add_argument("--print-script", choices=list(SCENARIOS), help="Print a synthetic script and exit.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of the pipeline.")
+    args = parser.parse_args(argv)
+
+    if args.print_script:
+        print("\n".join(synthetic_script(SCENARIOS[args.print_script], args.scale)))
+        return 0
+    if args.vfr and args.segmented:
+        parser.error("--vfr cannot be combined with --segmented, which encodes at a constant frame rate")
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    preset = get_preset(args.preset)
+    if args.vfr:
+        preset = preset._replace(vfr=True)
+    options = {"workers": args.workers, "preset": preset, "segmented": args.segmented,
+               "audio_engine": args.audio_engine}
+    results = {
+        "environment": environment(),
+        "options": recorded_options(args, preset),
+        "scenarios": {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        if name == "example":
+            lines = EXAMPLE_SCRIPT.read_text(encoding="utf8").splitlines()
+        else:
+            lines = synthetic_script(SCENARIOS[name], args.scale)
+        print(f"Running {name} ({len(lines)} lines) ×{args.repeat} …", file=sys.stderr)
+        results["scenarios"][name] = benchmark(name, lines, options, args.repeat, args.verbose)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf8")
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(output, args.save_baseline)
+
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf8"))
+        if baseline.get("options", {}) != results["options"]:
+            print("Warning: the baseline was recorded with different options", file=sys.stderr)
+    print_report(results, baseline)
+    print(f"Results → {output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, stage, old, new, ratio in regressions:
+            print(f"REGRESSION {name}/{stage}: {old:.3f}s → {new:.3f}s ({ratio - 1:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regression above {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
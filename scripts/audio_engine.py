@@ -0,0 +1,145 @@
+import logging
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, NamedTuple
+
+import numpy as np
+
+import ffmpeg_runner
+import tracing
+from sample_cache import CHANNELS, SAMPLE_RATE, load_sample, sample_file, write_wav
+
+log = logging.getLogger(__name__)
+
+# Peaks above this level are softly compressed by the NumPy mixer's limiter
+LIMITER_THRESHOLD = 0.9
+
+# Filter graphs longer than this are passed to ffmpeg through a script file
+MAX_INLINE_FILTER = 4000
+
+
+class Cue(NamedTuple):
+    """One sound effect placed at ``start`` seconds on the timeline."""
+    sound_file: Path
+    start: float
+
+
+def mix_with_ffmpeg(cues: List[Cue], duration: float, output_path: Path) -> None:
+    """
+    Renders all ``cues`` into a single WAV of ``duration`` seconds in one native
+    ffmpeg pass: every sound file is decoded once, split per use, delayed with
+    ``adelay`` and summed with ``amix``. Sounds already in the sample cache are
+    read from their decoded WAV instead of the MP3.
+    """
+    uses = OrderedDict()
+    for cue in cues:
+        uses.setdefault(str(sample_file(cue.sound_file)), []).append(cue.start)
+
+    inputs = []
+    filters = []
+    labels = []
+    for input_no, (sound_file, starts) in enumerate(uses.items()):
+        inputs += ["-i", sound_file]
+        source = f"[{input_no}:a]aresample={SAMPLE_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo"
+        if len(starts) == 1:
+            split = [f"s{input_no}_0"]
+            filters.append(f"{source}[{split[0]}]")
+        else:
+            split = [f"s{input_no}_{use}" for use in range(len(starts))]
+            filters.append(f"{source},asplit={len(starts)}" + "".join(f"[{label}]" for label in split))
+        for label, start in zip(split, starts):
+            delay = round(start * 1000)
+            labels.append(f"c{len(labels)}")
+            filters.append(f"[{label}]adelay={delay}|{delay}[{labels[-1]}]")
+
+    # normalize=0 sums the cues like CompositeAudioClip instead of scaling them down
+    filters.append(
+        "".join(f"[{label}]" for label in labels)
+        + f"amix=inputs={len(labels)}:duration=longest:dropout_transition=0:normalize=0,"
+        + f"atrim=end={duration:.6f}[out]"
+    )
+    graph = ";".join(filters)
+
+    ffmpeg_args = list(inputs)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if len(graph) > MAX_INLINE_FILTER:
+            script_path = Path(tmp_dir) / "filter_graph.txt"
+            script_path.write_text(graph, encoding="utf8")
+            ffmpeg_args += ["-filter_complex_script", str(script_path)]
+        else:
+            ffmpeg_args += ["-filter_complex", graph]
+        ffmpeg_args += ["-map", "[out]", "-c:a", "pcm_s16le", "-ar", str(SAMPLE_RATE), str(output_path)]
+
+        log.info("Mixing %d cue(s) from %d sound file(s) with ffmpeg", len(cues), len(uses))
+        ffmpeg_runner.run(ffmpeg_args, "mix the soundtrack")
+
+
+def mix_with_moviepy(cues: List[Cue], duration: float, output_path: Path) -> None:
+    """
+    Original mixer: one clip per cue summed by CompositeAudioClip. Clips wrap the
+    cached decoded samples, so each sound file is decoded only once.
+    """
+    from moviepy.audio.AudioClip import AudioArrayClip, CompositeAudioClip
+
+    clips = [AudioArrayClip(load_sample(cue.sound_file), fps=SAMPLE_RATE).set_start(cue.start) for cue in cues]
+    composite_audio = CompositeAudioClip(clips)
+    end = min(composite_audio.duration, duration)
+    log.info("Mixing %d cue(s) with moviepy", len(cues))
+    composite_audio.subclip(0, end).write_audiofile(str(output_path), fps=SAMPLE_RATE, logger=None)
+    for clip in clips:
+        clip.close()
+
+
+def mix_with_numpy(cues: List[Cue], duration: float, output_path: Path) -> None:
+    """
+    Sums the cached samples of all ``cues`` into one buffer covering the whole
+    timeline, each at an integer sample offset, then limits the peaks so the
+    mix never clips.
+    """
+    total = round(duration * SAMPLE_RATE)
+    mix = np.zeros((total, CHANNELS), dtype=np.float32)
+    for cue in cues:
+        offset = round(cue.start * SAMPLE_RATE)
+        if offset >= total:
+            continue
+        sample = load_sample(cue.sound_file)
+        length = min(len(sample), total - offset)
+        mix[offset:offset + length] += sample[:length]
+
+    log.info("Mixed %d cue(s) into %.2fs of audio with NumPy", len(cues), total / SAMPLE_RATE)
+    write_wav(output_path, limit(mix))
+
+
+def limit(mix: np.ndarray, threshold: float = LIMITER_THRESHOLD) -> np.ndarray:
+    """
+    Soft limiter: samples below ``threshold`` pass untouched, louder ones are
+    squashed with tanh so they approach but never exceed full scale.
+    """
+    magnitude = np.abs(mix)
+    loud = magnitude > threshold
+    if not loud.any():
+        return mix
+    headroom = 1.0 - threshold
+    squashed = threshold + headroom * np.tanh((magnitude[loud] - threshold) / headroom)
+    limited = mix.copy()
+    limited[loud] = np.copysign(squashed, mix[loud])
+    return limited
+
+
+ENGINES = {
+    "numpy": mix_with_numpy,
+    "ffmpeg": mix_with_ffmpeg,
+    "moviepy": mix_with_moviepy,
+}
+DEFAULT_ENGINE = "numpy"
+
+
+def mix_soundtrack(cues: List[Cue], duration: float, output_path: Path, engine: str = DEFAULT_ENGINE) -> None:
+    """Writes the soundtrack of ``cues`` to ``output_path`` (WAV) with the chosen engine."""
+    try:
+        mixer = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f"Unknown audio engine '{engine}', expected one of: {', '.join(ENGINES)}") from None
+    with tracing.span("audio mix", "audio", engine=engine, cues=len(cues)):
+        mixer(cues, duration, Path(output_path))
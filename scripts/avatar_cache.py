@@ -0,0 +1,84 @@
+import sys
+import hashlib
+import os
+import threading
+from pathlib import Path
+from PIL import Image, ImageChops, ImageDraw
+
+import tracing
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = Path(sys.executable).resolve().parent
+else:
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+AVATAR_CACHE_DIR = BASE_DIR / "cache" / "avatars"
+
+# Set to True (or call configure()) to keep processed avatars on disk between runs
+PERSIST_AVATARS = False
+
+# (name, profile picture path, mtime, size) -> circular RGBA avatar
+_avatars = {}
+
+
+def configure(persist=True, cache_dir=None):
+    """Enables/disables the on-disk avatar cache and optionally moves it."""
+    global PERSIST_AVATARS, AVATAR_CACHE_DIR
+    PERSIST_AVATARS = persist
+    if cache_dir is not None:
+        AVATAR_CACHE_DIR = Path(cache_dir)
+
+
+def clear():
+    """Drops every avatar held in memory (the disk cache is left alone)."""
+    _avatars.clear()
+
+
+def get_avatar(name, profpic_file, size):
+    """
+    Returns the avatar of character ``name`` as a circular RGBA image ``size`` px high,
+    ready to be pasted with itself as the mask. The result is shared between callers
+    and must not be modified.
+    """
+    profpic_file = Path(profpic_file)
+    mtime = profpic_file.stat().st_mtime_ns
+    key = (name, str(profpic_file), mtime, size)
+    avatar = _avatars.get(key)
+    tracing.count_lookup("avatar", avatar is not None)
+    if avatar is not None:
+        return avatar
+
+    disk_path = None
+    if PERSIST_AVATARS:
+        digest = hashlib.sha1(f"{profpic_file}|{mtime}".encode("utf8")).hexdigest()[:12]
+        disk_path = AVATAR_CACHE_DIR / f"{name}-{size}-{digest}.png"
+
+    with tracing.span("avatar", character=name, size=size):
+        if disk_path is not None and disk_path.exists():
+            avatar = Image.open(disk_path)
+            avatar.load()
+        else:
+            avatar = _make_avatar(profpic_file, size)
+            if disk_path is not None:
+                AVATAR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                # Write under a private name first: workers and service jobs may be reading it
+                tmp_path = disk_path.with_name(f".{disk_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+                try:
+                    avatar.save(str(tmp_path), format="PNG")
+                    os.replace(tmp_path, disk_path)
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+
+    _avatars[key] = avatar
+    return avatar
+
+
+def _make_avatar(profpic_file, size):
+    """Decodes, resizes and masks a profile picture."""
+    with Image.open(profpic_file) as prof_pic:
+        prof_pic.thumbnail((sys.maxsize, size), Image.LANCZOS)
+        avatar = prof_pic.convert("RGBA")
+    mask = Image.new("L", avatar.size, 0)
+    ImageDraw.Draw(mask).ellipse([(0, 0), (size, size)], fill=255)
+    avatar.putalpha(ImageChops.multiply(avatar.getchannel("A"), mask))
+    return avatar
@@ -0,0 +1,252 @@
+"""
+Headless entry point: render chat videos without the PyQt5 GUI.
+
+    python scripts/beluga.py render script.txt -o out.mp4
+    python scripts/beluga.py validate script.txt
+    python scripts/beluga.py seed-emojis script.txt
+
+or from Python:
+
+    from beluga import RenderOptions, render
+    render("script.txt", RenderOptions(output="out.mp4", workers=8))
+"""
+import sys
+import argparse
+import datetime
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+import emoji_store
+import frame_cache
+import tracing
+from audio_engine import DEFAULT_ENGINE, ENGINES
+from compile_images import gen_vid, stream_vid
+from ffmpeg_runner import FFmpegError
+from generate_chat import save_images
+from presets import DEFAULT_PRESET, PRESETS, OutputPreset, get_preset
+from script_compiler import compile_script
+from script_validator import validate_script_lines
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = Path(sys.executable).resolve().parent
+else:
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+class ScriptValidationError(ValueError):
+    """Raised by :func:`render` when the script does not pass validation."""
+
+    def __init__(self, errors):
+        super().__init__("Script has issues:\n" + "\n".join(errors))
+        self.errors = errors
+
+
+class RenderOptions(NamedTuple):
+    """Settings of a :func:`render` job."""
+    output: Path = BASE_DIR / "final_video.mp4"
+    start_time: Optional[datetime.datetime] = None  # clock of the first message (default: now)
+    workers: int = 1                                 # frame rendering processes
+    seed: Optional[int] = None                       # makes joined-message choices reproducible
+    stream: bool = False                             # pipe frames to ffmpeg instead of writing PNGs
+    audio_engine: str = DEFAULT_ENGINE
+    work_dir: Optional[Path] = None                  # intermediate files (default: a temporary directory)
+    segmented: bool = False                          # assemble the video from cached segments (PNG mode only)
+    preset: Union[str, OutputPreset] = DEFAULT_PRESET  # resolution, fps and encoder settings, see presets.PRESETS
+    history: bool = False                            # keep the whole conversation on screen, scrolling up
+
+
+def read_script(script):
+    """Returns the lines of ``script``, which is a file path or an iterable of lines."""
+    if isinstance(script, (str, Path)):
+        with open(script, encoding="utf8") as f:
+            return f.read().splitlines()
+    return list(script)
+
+
+def render(script, options: Optional[RenderOptions] = None, on_progress=None, cancel=None) -> Path:
+    """
+    Validates ``script`` and renders it to ``options.output``.
+    ``on_progress`` receives the :class:`ffmpeg_runner.Progress` of the video
+    encode; setting ``cancel`` (a :class:`threading.Event`) aborts it with
+    :class:`ffmpeg_runner.FFmpegCancelled`.
+    Returns the path of the final video.
+    """
+    options = options or RenderOptions()
+    filename = str(script) if isinstance(script, (str, Path)) else "<script>"
+    lines = read_script(script)
+
+    errors = validate_script_lines(lines)
+    if errors:
+        raise ScriptValidationError(errors)
+    timeline = compile_script(lines)
+    start_time = options.start_time or datetime.datetime.now()
+    preset = get_preset(options.preset)
+    if preset.vfr and (options.stream or options.segmented):
+        raise ValueError("A VFR preset cannot be streamed or segmented, which encode at a constant frame rate")
+    output = Path(options.output).resolve()
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(prefix="beluga-") as tmp_dir:
+        work_dir = Path(options.work_dir) if options.work_dir is not None else Path(tmp_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        if options.stream:
+            video = stream_vid(filename, start_time, timeline=timeline, workers=options.workers,
+                               seed=options.seed, work_dir=work_dir, output_path=output,
+                               engine=options.audio_engine, preset=preset, on_progress=on_progress, cancel=cancel,
+                               history=options.history)
+            if frame_cache.PERSIST_FRAMES:
+                frame_cache.prune()
+            return video
+
+        chat_dir = work_dir / "chat"
+        save_images(lines, start_time, timeline=timeline, workers=options.workers,
+                    seed=options.seed, chat_dir=chat_dir, size=preset.size, history=options.history)
+        if frame_cache.PERSIST_FRAMES:
+            frame_cache.prune()
+        return gen_vid(filename, timeline=timeline, chat_dir=chat_dir, work_dir=work_dir,
+                       output_path=output, engine=options.audio_engine, segmented=options.segmented,
+                       preset=preset, on_progress=on_progress, cancel=cancel)
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+def print_progress(progress, stream=sys.stderr):
+    """Shows an encode :class:`ffmpeg_runner.Progress` as a single, updating line on ``stream``."""
+    fraction = progress.fraction
+    line = f"Encoding: {_format_seconds(progress.seconds)}"
+    if progress.duration:
+        line += f" / {_format_seconds(progress.duration)}"
+    if fraction is not None:
+        line += f"  {fraction:4.0%}"
+    if progress.done:
+        line += f"  done in {progress.elapsed:.1f}s"
+    elif progress.eta is not None:
+        line += f"  ETA {_format_seconds(progress.eta)}"
+    stream.write(f"\r{line:<60}" + ("\n" if progress.done else ""))
+    stream.flush()
+
+
+def _parse_time(value):
+    try:
+        clock = datetime.datetime.strptime(value, "%H:%M")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected HH:MM, got '{value}'") from None
+    return datetime.datetime.combine(datetime.date.today(), clock.time())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="beluga", description="Render Beluga-style chat videos from text scripts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render_cmd = commands.add_parser("render", help="Render a script to a video.")
+    render_cmd.add_argument("script_file", help="Path to the script text file.")
+    render_cmd.add_argument("-o", "--output", default=str(BASE_DIR / "final_video.mp4"),
+                            help="Where to write the video (default: final_video.mp4).")
+    render_cmd.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                            help="Frame rendering processes (default: one per CPU).")
+    render_cmd.add_argument("--seed", type=int, help="Seed for the joined-message texts and arrows.")
+    render_cmd.add_argument("--start-time", type=_parse_time, help="Clock of the first message, as HH:MM.")
+    render_cmd.add_argument("--stream", action="store_true", help="Pipe frames to ffmpeg instead of writing PNGs.")
+    render_cmd.add_argument("--history", action="store_true",
+                            help="Show the whole conversation like a Discord channel instead of only the current "
+                                 "speaker (scrolls smoothly with --stream).")
+    render_cmd.add_argument("--audio-engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE,
+                            help=f"Sound effect mixer (default: {DEFAULT_ENGINE}).")
+    render_cmd.add_argument("--work-dir", help="Keep intermediate files (frames, output.mp4) in this directory.")
+    render_cmd.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET,
+                            help=f"Resolution, frame rate and quality of the video (default: {DEFAULT_PRESET}).")
+    render_cmd.add_argument("--fps", type=int, help="Override the frame rate of the preset, e.g. 5 for quick drafts.")
+    render_cmd.add_argument("--tune-stillimage", action="store_true",
+                            help="Tune x264 for still images (smaller, faster encodes of static frames).")
+    render_cmd.add_argument("--vfr", action="store_true",
+                            help="Encode each chat image once with its own timestamp instead of at a constant frame rate "
+                                 "(PNG mode only: not with --stream or --segmented).")
+    render_cmd.add_argument("--segmented", action="store_true",
+                            help="Encode the video in cached segments; only segments whose frames changed are re-encoded.")
+    render_cmd.add_argument("--frame-cache", action="store_true",
+                            help="Reuse unchanged frames from cache/frames (needs --start-time and --seed to hit).")
+    render_cmd.add_argument("--no-progress", action="store_true", help="Do not show the encoding progress.")
+    render_cmd.add_argument("--trace", metavar="FILE",
+                            help="Write a Chrome trace (for ui.perfetto.dev) of every stage and cache lookup.")
+    render_cmd.add_argument("--profile", metavar="FILE", help="Write cProfile statistics of the render.")
+    render_cmd.add_argument("--trace-memory", metavar="FILE", help="Write the largest allocation sites (tracemalloc).")
+
+    validate_cmd = commands.add_parser("validate", help="Check a script for errors.")
+    validate_cmd.add_argument("script_file", help="Path to the script text file.")
+
+    seed_cmd = commands.add_parser("seed-emojis",
+                                   help="Download the emoji images of a script into assets/emoji/ (needs internet).")
+    seed_cmd.add_argument("script_file", help="Path to the script text file.")
+
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.script_file):
+        print(f"Script not found: {args.script_file}")
+        return 1
+
+    if args.command == "validate":
+        lines = read_script(args.script_file)
+        errors = validate_script_lines(lines)
+        missing = emoji_store.missing_emojis(lines)
+        if missing:
+            print(f"Emojis missing from {emoji_store.EMOJI_DIR} (drawn with a fallback font): {' '.join(missing)}")
+            print(f"  Seed them with: python scripts/beluga.py seed-emojis {args.script_file}")
+        if errors:
+            print("Script validation found issues:")
+            for error in errors:
+                print("  -", error)
+            return 1
+        print("Script validation successful: no problems found.")
+        return 0
+
+    if args.command == "seed-emojis":
+        missing = emoji_store.seed_emoji_store(read_script(args.script_file))
+        if missing:
+            print("Could not fetch:", " ".join(missing))
+            return 1
+        print(f"Emoji store is complete: {emoji_store.EMOJI_DIR}")
+        return 0
+
+    if args.vfr and (args.stream or args.segmented):
+        parser.error("--vfr cannot be combined with --stream or --segmented, which encode at a constant frame rate")
+    if args.frame_cache:
+        frame_cache.configure(persist=True)
+    preset = get_preset(args.preset)
+    if args.fps:
+        preset = preset._replace(fps=args.fps)
+    if args.tune_stillimage:
+        preset = preset._replace(tune="stillimage")
+    if args.vfr:
+        preset = preset._replace(vfr=True)
+    options = RenderOptions(
+        output=Path(args.output),
+        start_time=args.start_time,
+        workers=args.workers,
+        seed=args.seed,
+        stream=args.stream,
+        audio_engine=args.audio_engine,
+        work_dir=Path(args.work_dir) if args.work_dir else None,
+        segmented=args.segmented,
+        preset=preset,
+        history=args.history,
+    )
+    try:
+        with tracing.session(args.trace, args.profile, args.trace_memory):
+            output = render(args.script_file, options, on_progress=None if args.no_progress else print_progress)
+    except ScriptValidationError as e:
+        print(e)
+        return 1
+    except FFmpegError as e:
+        print(e)
+        return 1
+    print(f"Video → {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
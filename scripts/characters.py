@@ -0,0 +1,43 @@
+import sys
+import json
+import threading
+from pathlib import Path
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = Path(sys.executable).resolve().parent
+else:
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+CHARACTERS_FILE = BASE_DIR / 'assets' / 'profile_pictures' / 'characters.json'
+
+_lock = threading.Lock()
+_loaded_mtime = None
+_characters = {}
+
+
+def get_characters():
+    """
+    Returns the character registry from ``characters.json``. The file is read on
+    first use and read again whenever its modification time changes, so long-lived
+    processes pick up new characters without a restart.
+    """
+    global _loaded_mtime, _characters
+    mtime = CHARACTERS_FILE.stat().st_mtime_ns
+    if mtime != _loaded_mtime:
+        with _lock:
+            if mtime != _loaded_mtime:
+                with open(CHARACTERS_FILE, encoding="utf8") as file:
+                    _characters = json.load(file)
+                _loaded_mtime = mtime
+    return _characters
+
+
+def get_character(name):
+    """Returns the ``{"profile_pic": ..., "role_color": ...}`` entry of ``name``."""
+    return get_characters()[name]
+
+
+def reload():
+    """Forces the next lookup to read ``characters.json`` again."""
+    global _loaded_mtime
+    _loaded_mtime = None
@@ -1,6 +1,19 @@
 import sys
 import os
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import ffmpeg_runner
+import frame_cache
+import tracing
+from ffmpeg_runner import Progress
 from sound_effects import add_sounds
+from audio_engine import DEFAULT_ENGINE
+from script_compiler import compile_file
+from generate_chat import ease_scroll, iter_history, iter_images
+from presets import DEFAULT_PRESET, get_preset
 from pathlib import Path
 
 # ----------------------------------------------------------------
@@ -10,53 +23,353 @@ if getattr(sys, 'frozen', False):
     BASE_DIR = Path(sys.executable).resolve().parent
 else:
     BASE_DIR = Path(__file__).resolve().parent.parent
-    
-def gen_vid(filename):
-    input_folder = BASE_DIR / "chat" 
+
+SEGMENT_CACHE_DIR = BASE_DIR / "cache" / "segments"
+# The segment cache keeps the most recently used segments up to this size, and drops segments unused for this long
+SEGMENT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+SEGMENT_CACHE_MAX_AGE = 30 * 24 * 3600
+# A new block starts a new segment once the current one is at least this long
+MIN_SEGMENT_SECONDS = 2.0
+# Longest stretch of a variable frame rate video without a keyframe, for seeking
+VFR_KEYFRAME_SECONDS = 2
+# Length of the scroll animation to a new message in the streamed full-history view
+SCROLL_SECONDS = 0.2
+
+# Size and frame rate of the default output preset
+VIDEO_SIZE = get_preset(DEFAULT_PRESET).size
+VIDEO_FPS = get_preset(DEFAULT_PRESET).fps
+
+def gen_vid(filename, timeline=None, chat_dir=None, work_dir=None, output_path=None, engine=DEFAULT_ENGINE,
+            segmented=False, preset=None, on_progress=None, cancel=None):
+    """
+    Encodes the PNGs of ``chat_dir`` (default: ``chat/``) into ``output.mp4`` in
+    ``work_dir`` (default: the repository root), then adds the sound effects.
+    ``preset`` (a name or an :class:`presets.OutputPreset`) sets the resolution,
+    frame rate and encoder settings; with ``preset.vfr`` every image is encoded
+    once, stamped with its start time, so the encode takes as long as the number
+    of messages rather than the length of the video. With ``segmented``, the
+    video is assembled from cached (constant frame rate) segments, see
+    :func:`encode_segmented`.
+    ``on_progress`` receives the :class:`ffmpeg_runner.Progress` of the encode;
+    setting ``cancel`` (a :class:`threading.Event`) stops it with
+    :class:`ffmpeg_runner.FFmpegCancelled`.
+    Returns the path of the final video.
+    """
+    work_dir = (Path(work_dir) if work_dir is not None else BASE_DIR).resolve()
     print(f"Selected gen_vid : {filename}")
-    image_files = sorted([f for f in os.listdir(input_folder) if f.endswith('.png')])
-
-    # Read durations from the file.
-    durations = []
-    with open(filename, encoding="utf8") as f:
-        name_up_next = True
-        lines = f.read().splitlines()
-        for line in lines:
-            if line == '':
-                name_up_next = True
-                continue
-            elif line[0] == '#':
-                continue
-            elif line.startswith("WELCOME"):
-                if "#!" in line:
-                    durations.append(line.split('$^')[1].split("#!")[0])
-                else:
-                    durations.append(line.split('$^')[1])
-                continue
-            elif name_up_next == True:
-                name_up_next = False
-                continue
-            else:
-                if "#!" in line:
-                    durations.append(line.split('$^')[1].split("#!")[0])
-                else:
-                    durations.append(line.split('$^')[1])
+    if timeline is None:
+        timeline = compile_file(filename)
+
+    encode_video(timeline, chat_dir, work_dir, segmented, preset, on_progress=on_progress, cancel=cancel)
+    return add_sounds(filename, timeline=timeline, engine=engine, work_dir=work_dir, output_path=output_path,
+                      cancel=cancel)
+
+
+@tracing.traced("encode video", "stage")
+def encode_video(timeline, chat_dir=None, work_dir=None, segmented=False, preset=None, on_progress=None,
+                 cancel=None):
+    """
+    The silent half of :func:`gen_vid`: encodes the PNGs of ``chat_dir`` into
+    ``output.mp4`` in ``work_dir`` and returns its path.
+    """
+    preset = get_preset(preset)
+    input_folder = (Path(chat_dir) if chat_dir is not None else BASE_DIR / "chat").resolve()
+    work_dir = (Path(work_dir) if work_dir is not None else BASE_DIR).resolve()
+    video_path = work_dir / "output.mp4"
+
+    if segmented:
+        if preset.vfr:
+            raise ValueError("Segmented encodes are constant frame rate; a VFR preset needs the PNG concat path")
+        return encode_segmented(timeline, input_folder, video_path, work_dir, preset,
+                                on_progress=on_progress, cancel=cancel)
+
+    # One image per timeline frame, named by save_images() after the frame index.
+    image_files = [f"{frame.index + 1:03d}.png" for frame in timeline.frames]
+    durations = [frame.duration for frame in timeline.frames]
     print(f" gen_vid : {image_files}")    
     # Create a text file to store the image paths
-    with open( os.path.join(BASE_DIR , 'image_paths.txt'), 'w') as file:    
-        count = 0
-        for image_file in image_files:
-            file.write(f"file '{input_folder}\{image_file}'\noutpoint {durations[count]}\n")
-            count += 1
-        file.write(f"file '{input_folder}\{image_files[-1]}'\noutpoint 0.04\n")
-
-    video_width, video_height = 1280, 720
-    ffmpeg_cmd = (
-        f"ffmpeg -f concat -safe 0 -i image_paths.txt -vcodec libx264 -r 25 -crf 25 "
-        f"-vf \"scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,"
-        f"pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2\" -pix_fmt yuv420p output.mp4"
-    )
-    os.system(ffmpeg_cmd)
-    os.remove('image_paths.txt')
-
-    add_sounds(filename)
\ No newline at end of file
+    list_path = work_dir / 'image_paths.txt'
+    with open(list_path, 'w') as file:
+        if preset.vfr:
+            # Each image becomes a single frame stamped at its start time; the concat
+            # demuxer ignores the last duration, so the last image closes the video
+            for image_file, duration in zip(image_files, durations):
+                file.write(f"file '{(input_folder / image_file).as_posix()}'\nduration {duration}\n")
+            file.write(f"file '{(input_folder / image_files[-1]).as_posix()}'\n")
+        else:
+            for image_file, duration in zip(image_files, durations):
+                file.write(f"file '{(input_folder / image_file).as_posix()}'\noutpoint {duration}\n")
+            file.write(f"file '{(input_folder / image_files[-1]).as_posix()}'\noutpoint 0.04\n")
+
+    video_width, video_height = preset.size
+    with Image.open(input_folder / image_files[0]) as first_image:
+        prescaled = first_image.size == preset.size
+    # Frames rendered at the video size (save_images(size=preset.size)) need no scaling
+    scale_filter = [] if prescaled else [
+        "-vf", f"scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,"
+               f"pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2"
+    ]
+    frame_rate = vfr_args() if preset.vfr else ["-r", str(preset.fps)]
+    ffmpeg_args = [
+        "-f", "concat", "-safe", "0", "-i", list_path, *preset.x264_args(), *frame_rate, *scale_filter,
+        video_path
+    ]
+    try:
+        ffmpeg_runner.run(ffmpeg_args, "encode the video", duration=timeline.duration,
+                          on_progress=on_progress, cancel=cancel)
+    finally:
+        os.remove(list_path)
+    return video_path
+
+
+def vfr_args():
+    """
+    ffmpeg output arguments of a variable frame rate video: frames keep their
+    timestamps instead of being duplicated up to a constant rate, and a keyframe
+    is forced at least every ``VFR_KEYFRAME_SECONDS`` so players can still seek.
+    ffmpeg before 5.1 has no ``-fps_mode`` and gets the older ``-vsync`` instead.
+    """
+    ffmpeg_version = ffmpeg_runner.version()
+    if ffmpeg_version is not None and ffmpeg_version < (5, 1):
+        fps_mode = ["-vsync", "vfr"]
+    else:
+        fps_mode = ["-fps_mode", "vfr"]
+    return fps_mode + ["-force_key_frames", f"expr:gte(t,n_forced*{VFR_KEYFRAME_SECONDS})"]
+
+
+def frame_counts(timeline, fps=VIDEO_FPS):
+    """
+    Number of video frames each timeline frame is shown for. Start times are
+    rounded and each frame ends where the next one starts, so holds never drift.
+    """
+    edges = [round(frame.start * fps) for frame in timeline.frames] + [round(timeline.duration * fps)]
+    return [end - start for start, end in zip(edges, edges[1:])]
+
+
+def plan_segments(timeline, fps=VIDEO_FPS):
+    """
+    Splits the timeline into segments of whole blocks, each at least
+    ``MIN_SEGMENT_SECONDS`` long (except the last). Returns a list of segments,
+    each a list of (frame, video frame count) pairs.
+    """
+    segments = []
+    length = 0
+    for frame, count in zip(timeline.frames, frame_counts(timeline, fps)):
+        if not segments or (frame.block_start == frame.index and length >= MIN_SEGMENT_SECONDS * fps):
+            segments.append([])
+            length = 0
+        segments[-1].append((frame, count))
+        length += count
+    return segments
+
+
+def _segment_key(entries, preset):
+    digest = hashlib.sha256(repr((preset.size, preset.fps, preset.x264_args())).encode("utf8"))
+    for image_path, count in entries:
+        digest.update(hashlib.sha1(image_path.read_bytes()).digest())
+        digest.update(count.to_bytes(4, "little"))
+    return digest.hexdigest()
+
+
+def _encode_segment(entries, preset, segment_path, on_progress=None, cancel=None):
+    """
+    Encodes one segment: each image is held for exactly ``count`` frames. Frames
+    are piped raw, since the concat demuxer shifts holds by a frame whenever the
+    image size changes.
+    """
+    size = preset.size
+    tmp_path = segment_path.with_name(f".{segment_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.mp4")
+    ffmpeg_args = [
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", str(preset.fps), "-i", "-",
+        *preset.x264_args(), "-an", tmp_path
+    ]
+    duration = sum(count for _, count in entries) / preset.fps
+    try:
+        with ffmpeg_runner.pipe(ffmpeg_args, f"encode {segment_path.name}", duration, on_progress, cancel) as process:
+            for image_path, count in entries:
+                with Image.open(image_path) as image:
+                    data = fit_frame(image, size).tobytes()
+                for _ in range(count):
+                    process.write(data)
+            process.wait()
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, segment_path)
+
+
+def encode_segmented(timeline, chat_dir, video_path, work_dir, preset=None, on_progress=None, cancel=None):
+    """
+    Encodes the frames of ``chat_dir`` segment by segment and joins the segments
+    into ``video_path`` with stream copy. Every segment starts on a keyframe and
+    is cached in ``SEGMENT_CACHE_DIR`` under the hash of its images and
+    durations, so after an edit only the segments it touches are encoded again.
+    ``on_progress`` gets the combined progress of the segments being encoded.
+    """
+    preset = get_preset(preset)
+    chat_dir = Path(chat_dir).resolve()
+    work_dir = Path(work_dir).resolve()
+    started = time.monotonic()
+    SEGMENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    segment_paths = []
+    missing = []
+    for segment in plan_segments(timeline, preset.fps):
+        entries = [(chat_dir / f"{frame.index + 1:03d}.png", count) for frame, count in segment if count > 0]
+        if not entries:
+            continue
+        segment_path = SEGMENT_CACHE_DIR / f"{_segment_key(entries, preset)}.mp4"
+        segment_paths.append(segment_path)
+        cached = segment_path.exists()
+        tracing.count_lookup("segments", cached)
+        if cached:
+            frame_cache.touch(segment_path)
+        elif segment_path not in {path for _, path in missing}:
+            missing.append((entries, segment_path))
+
+    print(f" gen_vid : encoding {len(missing)} of {len(segment_paths)} segment(s)")
+    if missing:
+        report = _combined_progress(missing, preset, started, on_progress) if on_progress is not None else None
+        segment_cancel = _SegmentCancel(cancel)
+        # x264 threads poorly on short clips; encode a few segments side by side
+        with ThreadPoolExecutor(max_workers=min(len(missing), max(1, (os.cpu_count() or 1) // 2))) as executor:
+            jobs = [
+                executor.submit(_encode_segment, entries, preset, segment_path,
+                                report and (lambda progress, i=i: report(i, progress)), segment_cancel)
+                for i, (entries, segment_path) in enumerate(missing)
+            ]
+            try:
+                for job in jobs:
+                    job.result()
+            except BaseException:
+                # Stop the segments being encoded as well, not only the pending ones
+                segment_cancel.set()
+                for job in jobs:
+                    job.cancel()
+                raise
+
+    list_path = work_dir / "segments.txt"
+    with open(list_path, "w") as file:
+        for segment_path in segment_paths:
+            file.write(f"file '{segment_path.as_posix()}'\n")
+    ffmpeg_args = ["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-movflags", "+faststart", video_path]
+    try:
+        ffmpeg_runner.run(ffmpeg_args, "join the segments", cancel=cancel)
+    finally:
+        os.remove(list_path)
+    prune_segments()
+    if on_progress is not None:
+        on_progress(Progress("encode the video", 0, timeline.duration, timeline.duration,
+                             time.monotonic() - started, done=True))
+    return Path(video_path)
+
+
+class _SegmentCancel:
+    """
+    Cancel event of the segment encodes of one :func:`encode_segmented` call:
+    set by the caller's ``cancel`` or by the first segment that fails.
+    """
+
+    def __init__(self, cancel=None):
+        self._cancel = cancel
+        self._failed = threading.Event()
+
+    def set(self):
+        self._failed.set()
+
+    def is_set(self):
+        return self._failed.is_set() or (self._cancel is not None and self._cancel.is_set())
+
+
+def prune_segments(max_bytes=SEGMENT_CACHE_MAX_BYTES, max_age=SEGMENT_CACHE_MAX_AGE):
+    """Deletes the least recently used segments beyond ``max_bytes`` and those unused for ``max_age`` seconds."""
+    return frame_cache.prune_directory(SEGMENT_CACHE_DIR, "*.mp4", max_bytes, max_age)
+
+
+def _combined_progress(missing, preset, started, on_progress):
+    """Folds the progress of segments encoded side by side into one :class:`Progress` for ``on_progress``."""
+    durations = [sum(count for _, count in entries) / preset.fps for entries, _ in missing]
+    total = sum(durations)
+    lock = threading.Lock()
+    seconds = [0.0] * len(missing)
+    frames = [0] * len(missing)
+
+    def report(index, progress):
+        with lock:
+            seconds[index] = durations[index] if progress.done else min(progress.seconds, durations[index])
+            frames[index] = progress.frame
+            combined = Progress("encode the video", sum(frames), sum(seconds), total, time.monotonic() - started)
+        on_progress(combined)
+    return report
+
+
+def fit_frame(image, size):
+    """
+    Scales ``image`` down to fit ``size`` and centres it on a black canvas,
+    like ffmpeg's ``scale=...:force_original_aspect_ratio=decrease,pad=...``.
+    """
+    if image.size == tuple(size):
+        return image.convert("RGB")
+    width, height = size
+    scale = min(width / image.width, height / image.height)
+    if scale != 1:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.BICUBIC)
+    frame = Image.new("RGB", size, (0, 0, 0))
+    frame.paste(image.convert("RGB"), ((width - image.width) // 2, (height - image.height) // 2))
+    return frame
+
+
+@tracing.traced("stream video", "stage")
+def stream_vid(filename, init_time, timeline=None, workers=1, seed=None, fps=None,
+               work_dir=None, output_path=None, engine=DEFAULT_ENGINE, preset=None, on_progress=None, cancel=None,
+               history=False):
+    """
+    Renders the chat frames and pipes them as raw RGB straight into a single
+    ffmpeg process, skipping the PNG files in ``chat/`` and their decoding.
+    Each frame is repeated for as many video frames as its duration covers:
+    raw video carries no timestamps, so the stream is always constant frame
+    rate and a ``preset.vfr`` preset is refused (use :func:`gen_vid`).
+    ``fps`` overrides the frame rate of ``preset``.
+    ``on_progress`` and ``cancel`` work as in :func:`gen_vid`.
+    With ``history``, frames show the whole conversation so far and scroll to
+    each new message over ``SCROLL_SECONDS``; the in-between frames are crops
+    of the same canvas, see :class:`generate_chat.HistoryFrame`.
+    Returns the path of the final video.
+    """
+    preset = get_preset(preset)
+    if preset.vfr:
+        raise ValueError("Streamed encodes are constant frame rate; a VFR preset needs the PNG concat path")
+    fps = fps or preset.fps
+    work_dir = (Path(work_dir) if work_dir is not None else BASE_DIR).resolve()
+    print(f"Selected stream_vid : {filename}")
+    if timeline is None:
+        timeline = compile_file(filename)
+
+    video_width, video_height = preset.size
+    video_path = work_dir / "output.mp4"
+    ffmpeg_args = [
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{video_width}x{video_height}", "-r", str(fps), "-i", "-",
+        *preset.x264_args(), video_path
+    ]
+    with ffmpeg_runner.pipe(ffmpeg_args, "encode the video", timeline.duration, on_progress, cancel) as process:
+        if history:
+            frames = iter_history(None, init_time, timeline=timeline, seed=seed, size=preset.size)
+            for frame, repeat in zip(frames, frame_counts(timeline, fps)):
+                steps = min(repeat, max(1, round(SCROLL_SECONDS * fps))) if frame.scroll else 0
+                for step in range(1, steps):
+                    image = frame.view(round(frame.scroll * ease_scroll(step / steps)))
+                    process.write(fit_frame(image, (video_width, video_height)).tobytes())
+                data = fit_frame(frame.view(), (video_width, video_height)).tobytes()
+                for _ in range(repeat - max(steps - 1, 0)):
+                    process.write(data)
+        else:
+            images = iter_images(None, init_time, timeline=timeline, workers=workers, seed=seed, size=preset.size)
+            for image, repeat in zip(images, frame_counts(timeline, fps)):
+                data = fit_frame(image, (video_width, video_height)).tobytes()
+                for _ in range(repeat):
+                    process.write(data)
+        process.wait()
+
+    return add_sounds(filename, timeline=timeline, engine=engine, work_dir=work_dir, output_path=output_path,
+                      cancel=cancel)
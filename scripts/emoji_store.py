@@ -0,0 +1,316 @@
+import sys
+import argparse
+import hashlib
+import logging
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageDraw, ImageFont
+from pilmoji import Pilmoji
+from pilmoji.helpers import NodeType, to_nodes
+from pilmoji.source import BaseSource, Twemoji
+
+import tracing
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = Path(sys.executable).resolve().parent
+else:
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Twemoji-style sprites named by code points, e.g. "1f480.png" or "1f468-200d-1f373.png"
+EMOJI_DIR = BASE_DIR / "assets" / "emoji"
+EMOJI_CACHE_SIZE = 512
+
+# Fonts that draw emojis missing from the store, first match wins. Colour fonts
+# first; DejaVu Sans has few emojis, but its box glyph still marks the spot.
+FALLBACK_FONTS = (
+    BASE_DIR / "assets" / "fonts" / "emoji.ttf",
+    Path("C:/Windows/Fonts/seguiemj.ttf"),
+    Path("/System/Library/Fonts/Apple Color Emoji.ttc"),
+    Path("/usr/share/fonts/truetype/noto/NotoColorEmoji.ttf"),
+    Path("/usr/share/fonts/noto/NotoColorEmoji.ttf"),
+    Path("/usr/share/fonts/google-noto-emoji/NotoColorEmoji.ttf"),
+    Path("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"),
+    Path("/usr/share/fonts/dejavu/DejaVuSans.ttf"),
+    Path("/Library/Fonts/Arial Unicode.ttf"),
+    Path("C:/Windows/Fonts/seguisym.ttf"),
+)
+# Bitmap colour fonts only load at their strike size (109 for Noto, 160 for Apple)
+FALLBACK_SIZES = (72, 109, 160)
+# Colour of emojis drawn with a monochrome fallback font
+FALLBACK_COLOR = (220, 221, 222)
+
+log = logging.getLogger(__name__)
+# Whether this process has already said how to seed the store
+_seed_hint_logged = False
+
+
+def emoji_filenames(emoji: str):
+    """Candidate sprite file names for ``emoji``, most specific first."""
+    codes = [f"{ord(char):x}" for char in emoji]
+    names = ["-".join(codes)]
+    # Twemoji drops the variation selector for everything but ZWJ sequences
+    stripped = [code for code in codes if code != "fe0f"]
+    if stripped and stripped != codes:
+        names.append("-".join(stripped))
+    return [f"{name}.png" for name in names]
+
+
+def emoji_sprite(emoji: str) -> Optional[Path]:
+    """The sprite of ``emoji`` in the store, or None."""
+    for name in emoji_filenames(emoji):
+        path = EMOJI_DIR / name
+        if path.is_file():
+            return path
+    return None
+
+
+@lru_cache(maxsize=None)
+def fallback_fonts():
+    """The :data:`FALLBACK_FONTS` installed on this machine, loaded."""
+    fonts = []
+    for path in FALLBACK_FONTS:
+        if not path.is_file():
+            continue
+        for size in FALLBACK_SIZES:
+            try:
+                fonts.append(ImageFont.truetype(str(path), size))
+                break
+            except OSError:
+                continue
+    return fonts
+
+
+def _render(font, text):
+    image = Image.new("RGBA", (font.size * 3, font.size * 2), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((0, 0), text, FALLBACK_COLOR, font=font, embedded_color=True)
+    return image.tobytes()
+
+
+def _draw_with_font(emoji: str) -> Optional[bytes]:
+    """Draws ``emoji`` with the first fallback font that has it, as a square PNG sprite."""
+    fonts = fallback_fonts()
+    if not fonts:
+        log.warning("No emoji font is installed – %r is left out", emoji)
+        return None
+    for font in fonts:
+        # A font without the glyph draws its "missing glyph" box instead
+        if _render(font, emoji) != _render(font, "\U0010fffd"):
+            chosen = font
+            break
+    else:
+        chosen = fonts[-1]
+        log.warning("No installed emoji font has %r – it is drawn as a box", emoji)
+    left, top, right, bottom = chosen.getbbox(emoji)
+    if right <= left or bottom <= top:
+        return None
+    glyph = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+    ImageDraw.Draw(glyph).text((-left, -top), emoji, FALLBACK_COLOR, font=chosen, embedded_color=True)
+    side = max(glyph.size)
+    sprite = Image.new("RGBA", (side, side), (0, 0, 0, 0))
+    sprite.paste(glyph, ((side - glyph.width) // 2, (side - glyph.height) // 2))
+    data = BytesIO()
+    sprite.save(data, "PNG")
+    return data.getvalue()
+
+
+def sprite_snapshot(emoji: str):
+    """(path, mtime) of the sprite of ``emoji`` in the store as it is now, or None."""
+    path = emoji_sprite(emoji)
+    if path is None:
+        return None
+    try:
+        return path, path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_emoji(emoji: str) -> Optional[bytes]:
+    """
+    The sprite of ``emoji`` as the store has it now, or its fallback drawing.
+    Sprites are cached per (path, mtime), so a sprite seeded or replaced while
+    the process runs is used from the next frame on.
+    """
+    return _load_emoji(emoji, sprite_snapshot(emoji))
+
+
+@lru_cache(maxsize=EMOJI_CACHE_SIZE)
+def _load_emoji(emoji: str, snapshot) -> Optional[bytes]:
+    if snapshot is not None:
+        try:
+            return snapshot[0].read_bytes()
+        except OSError:
+            pass
+    global _seed_hint_logged
+    if not _seed_hint_logged:
+        _seed_hint_logged = True
+        log.warning("The emoji store %s is missing sprites; seed it with: "
+                    "python scripts/beluga.py seed-emojis <script.txt>", EMOJI_DIR)
+    log.warning("Emoji %r not found in %s – drawing it with a fallback font", emoji, EMOJI_DIR)
+    return _draw_with_font(emoji)
+
+
+@lru_cache(maxsize=EMOJI_CACHE_SIZE)
+def _emoji_digest(emoji: str, snapshot) -> Optional[str]:
+    data = _load_emoji(emoji, snapshot)
+    return hashlib.sha1(data).hexdigest() if data is not None else None
+
+
+class SpriteSnapshot:
+    """
+    The sprites of the store as a render job first sees them: each emoji keeps
+    the (path, mtime) it was first looked up with, so the frame cache key of a
+    frame and its pixels come from the same sprites even if the store is
+    seeded while the job runs.
+    """
+
+    def __init__(self):
+        self.snapshots = {}
+
+    def snapshot(self, emoji: str):
+        if emoji not in self.snapshots:
+            self.snapshots[emoji] = sprite_snapshot(emoji)
+        return self.snapshots[emoji]
+
+    def load(self, emoji: str) -> Optional[bytes]:
+        """What :class:`LocalEmojiSource` draws for ``emoji``: its sprite or its fallback drawing."""
+        return _load_emoji(emoji, self.snapshot(emoji))
+
+    def digest(self, emoji: str) -> Optional[str]:
+        """sha1 of :meth:`load`, for frame cache keys."""
+        return _emoji_digest(emoji, self.snapshot(emoji))
+
+
+class LocalEmojiSource(BaseSource):
+    """
+    Pilmoji source that reads emoji sprites from ``assets/emoji/`` and never
+    touches the network; emojis missing from the store are drawn with the
+    first of :data:`FALLBACK_FONTS` that has them. Sprites are kept in a
+    process-wide LRU cache keyed by sprite path and mtime, so an emoji is read
+    from disk once per version of its sprite however many frames it appears in.
+    With a :class:`SpriteSnapshot`, sprites are drawn as that snapshot has them.
+    """
+
+    def __init__(self, sprites: Optional[SpriteSnapshot] = None):
+        super().__init__()
+        self.sprites = sprites
+
+    def _load(self, emoji):
+        return self.sprites.load(emoji) if self.sprites is not None else load_emoji(emoji)
+
+    def get_emoji(self, emoji: str, /) -> Optional[BytesIO]:
+        if tracing.ENABLED:
+            misses = _load_emoji.cache_info().misses
+            with tracing.span("emoji", emoji=emoji):
+                data = self._load(emoji)
+            tracing.count_lookup("emoji", _load_emoji.cache_info().misses == misses)
+        else:
+            data = self._load(emoji)
+        return BytesIO(data) if data is not None else None
+
+    def get_discord_emoji(self, id: int, /) -> Optional[BytesIO]:
+        return None
+
+
+# Shared by every Pilmoji instance in generate_chat
+EMOJI_SOURCE = LocalEmojiSource()
+
+
+class _ProbeSource(BaseSource):
+    """Pilmoji source that draws every emoji as an opaque square, to find where sprites land."""
+
+    def get_emoji(self, emoji: str, /) -> Optional[BytesIO]:
+        data = BytesIO()
+        Image.new("RGBA", (64, 64), (255, 255, 255, 255)).save(data, "PNG")
+        data.seek(0)
+        return data
+
+    def get_discord_emoji(self, id: int, /) -> Optional[BytesIO]:
+        return None
+
+
+@lru_cache(maxsize=EMOJI_CACHE_SIZE)
+def emoji_shift(font, text):
+    """
+    How far below ``emoji_position_offset`` Pilmoji draws the emoji sprites of
+    ``text`` with ``font``; 0 if ``text`` has no emojis. Recent Pilmoji versions
+    move sprites down by the ink offset of the text line, so the text is drawn
+    once with square sprites and looked at. Subtract it from the offset to put
+    sprites where the offset says.
+    """
+    margin = font.size * 2
+    size = (round(font.getlength(text) + font.size * len(text)) + margin, margin * 3)
+    image = Image.new("RGBA", size, (0, 0, 0, 0))
+    with Pilmoji(image, source=_ProbeSource()) as pilmoji:
+        pilmoji.text((0, margin), text, (0, 0, 0, 0), font=font)
+    bbox = image.getbbox()
+    return bbox[1] - margin if bbox is not None else 0
+
+
+def clear_cache():
+    """Forgets cached sprites, e.g. after new ones were added to the store."""
+    _load_emoji.cache_clear()
+    _emoji_digest.cache_clear()
+    fallback_fonts.cache_clear()
+    emoji_shift.cache_clear()
+
+
+def find_emojis(lines):
+    """Returns the unique emojis used in ``lines``, in order of appearance."""
+    found = {}
+    for line in lines:
+        for row in to_nodes(line):
+            for node in row:
+                if node.type is NodeType.emoji:
+                    found[node.content] = None
+    return list(found)
+
+
+def missing_emojis(lines):
+    """Returns the emojis used in ``lines`` that have no sprite in the store."""
+    return [emoji for emoji in find_emojis(lines) if emoji_sprite(emoji) is None]
+
+
+def seed_emoji_store(lines, source=Twemoji):
+    """
+    Downloads every emoji used in ``lines`` that is missing from the store.
+    Run this on a machine with network access; rendering only reads the store.
+    Returns the emojis that could not be fetched.
+    """
+    if isinstance(source, type):
+        source = source()
+    EMOJI_DIR.mkdir(parents=True, exist_ok=True)
+    missing = []
+    for emoji in missing_emojis(lines):
+        stream = source.get_emoji(emoji)
+        if stream is None:
+            missing.append(emoji)
+            continue
+        path = EMOJI_DIR / emoji_filenames(emoji)[0]
+        path.write_bytes(stream.getvalue())
+        print(f"[Emoji] Saved {emoji} → {path.name}")
+    clear_cache()
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-seed the local emoji store from script files.")
+    parser.add_argument("script_files", nargs="+", help="Script text files whose emojis should be downloaded.")
+    args = parser.parse_args()
+
+    lines = []
+    for filename in args.script_files:
+        with open(filename, encoding="utf8") as f:
+            lines.extend(f.read().splitlines())
+
+    missing = seed_emoji_store(lines)
+    if missing:
+        print("Could not fetch:", " ".join(missing))
+        sys.exit(1)
+    print(f"Emoji store is complete: {EMOJI_DIR}")
+
+
+if __name__ == '__main__':
+    main()
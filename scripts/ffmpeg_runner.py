@@ -0,0 +1,267 @@
+"""
+Runs ffmpeg as a subprocess: reports progress parsed from ``-progress``,
+can be cancelled from another thread and raises :class:`FFmpegError` with
+ffmpeg's own error output when it fails.
+
+    run(["-i", "in.mp4", "out.mp4"], description="encode", duration=83.0,
+        on_progress=lambda p: print(f"{p.fraction:.0%}, {p.eta:.0f}s left"))
+
+For frames piped on stdin, start it with :func:`pipe`, call ``write()`` for
+each frame and ``wait()`` at the end.
+"""
+import logging
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+import tracing
+
+log = logging.getLogger(__name__)
+
+FFMPEG = "ffmpeg"
+# Lines of stderr kept for the error message
+STDERR_LINES = 40
+# Seconds between two checks of the cancel event while waiting for ffmpeg
+POLL_INTERVAL = 0.1
+
+
+class FFmpegError(RuntimeError):
+    """ffmpeg exited with an error; ``stderr`` holds the end of its error output."""
+
+    def __init__(self, description, returncode, stderr, cmd=None):
+        message = f"ffmpeg could not {description} (exit status {returncode})"
+        if stderr:
+            message += f":\n{stderr}"
+        super().__init__(message)
+        self.description = description
+        self.returncode = returncode
+        self.stderr = stderr
+        self.cmd = cmd
+
+
+class FFmpegCancelled(Exception):
+    """The ``cancel`` event was set while ffmpeg was running; ffmpeg was killed."""
+
+    def __init__(self, description, cmd=None):
+        super().__init__(f"Cancelled: {description}")
+        self.description = description
+        self.cmd = cmd
+
+
+class Progress(NamedTuple):
+    """One progress report of a running ffmpeg job."""
+    description: str
+    frame: int                  # frames written so far
+    seconds: float              # output timestamp reached
+    duration: Optional[float]   # expected output length, if known
+    elapsed: float              # wall clock seconds since the start
+    done: bool = False
+
+    @property
+    def fraction(self):
+        """Share of the job done (0–1), or None without a known duration."""
+        if self.done:
+            return 1.0
+        if not self.duration:
+            return None
+        return min(1.0, max(0.0, self.seconds / self.duration))
+
+    @property
+    def eta(self):
+        """Estimated seconds left, or None while unknown."""
+        fraction = self.fraction
+        if fraction is None or fraction <= 0:
+            return None
+        return self.elapsed * (1 - fraction) / fraction
+
+
+ProgressCallback = Callable[[Progress], None]
+
+
+def _check_cancelled(cancel, description, cmd=None):
+    if cancel is not None and cancel.is_set():
+        raise FFmpegCancelled(description, cmd)
+
+
+class FFmpegProcess:
+    """
+    One ffmpeg run. ``args`` are the arguments after ``ffmpeg`` (paths are
+    passed as given, so make them absolute when the working directory matters).
+    ``on_progress`` is called from a reader thread with a :class:`Progress`
+    every time ffmpeg reports (about twice a second) and once at the end;
+    ``duration`` (seconds of output) lets it compute a fraction and an ETA.
+    Setting ``cancel`` (a :class:`threading.Event`) stops ffmpeg and raises
+    :class:`FFmpegCancelled` from :meth:`write` / :meth:`wait`.
+    With ``stdin``, frames are fed through :meth:`write`; with ``stdout``,
+    :meth:`wait` returns what ffmpeg wrote to its output ``-``.
+    """
+
+    def __init__(self, args, description="run", duration=None, on_progress: Optional[ProgressCallback] = None,
+                 cancel: Optional[threading.Event] = None, stdin=False, stdout=False):
+        self.description = description
+        self.duration = duration
+        self.on_progress = on_progress
+        self.cancel = cancel
+        self.cmd = [FFMPEG, "-y", "-hide_banner", "-nostats", "-loglevel", "error"]
+        if on_progress is not None and not stdout:
+            self.cmd += ["-progress", "pipe:1"]
+        self.cmd += [str(arg) if isinstance(arg, Path) else arg for arg in args]
+        self._stdin = stdin
+        self._stdout = stdout
+        self._stdout_chunks = []
+        self._stderr = deque(maxlen=STDERR_LINES)
+        self._started = None
+        self._trace_start = None
+        self._last_progress = None
+        self._process = None
+        self._threads = []
+
+    # --- lifecycle -----------------------------------------------------
+    def start(self):
+        _check_cancelled(self.cancel, self.description, self.cmd)
+        log.debug("Running: %s", subprocess.list2cmdline(self.cmd))
+        self._started = time.monotonic()
+        self._trace_start = tracing.now()
+        self._process = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE if self._stdin else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # Drain both pipes in the background, so ffmpeg never blocks on a full pipe
+        readers = [(self._read_stderr, "stderr"),
+                   (self._read_stdout if self._stdout else self._read_progress, "stdout")]
+        for target, name in readers:
+            thread = threading.Thread(target=target, name=f"ffmpeg-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.kill()
+        return False
+
+    def kill(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    # --- input ---------------------------------------------------------
+    def write(self, data):
+        """Sends ``data`` to ffmpeg's stdin."""
+        _check_cancelled(self.cancel, self.description, self.cmd)
+        try:
+            self._process.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            # ffmpeg stopped reading: it failed, wait() says why
+            self.wait()
+            raise
+
+    def wait(self):
+        """
+        Closes stdin, waits for ffmpeg to finish and raises :class:`FFmpegError`
+        if it failed. Returns ffmpeg's stdout when it was requested.
+        """
+        if self._process.stdin is not None and not self._process.stdin.closed:
+            try:
+                self._process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+        while True:
+            try:
+                returncode = self._process.wait(timeout=POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                if self.cancel is not None and self.cancel.is_set():
+                    self.kill()
+                    tracing.complete(f"ffmpeg: {self.description}", self._trace_start, "ffmpeg", cancelled=True)
+                    raise FFmpegCancelled(self.description, self.cmd) from None
+        for thread in self._threads:
+            thread.join()
+        tracing.complete(f"ffmpeg: {self.description}", self._trace_start, "ffmpeg", returncode=returncode,
+                         cmd=subprocess.list2cmdline(self.cmd))
+        if returncode != 0:
+            stderr = "\n".join(self._stderr).strip()
+            log.error("ffmpeg could not %s: %s", self.description, stderr)
+            raise FFmpegError(self.description, returncode, stderr, self.cmd)
+        if self.on_progress is not None:
+            last = self._last_progress
+            self._report(Progress(self.description, last.frame if last else 0,
+                                  self.duration or (last.seconds if last else 0.0), self.duration,
+                                  time.monotonic() - self._started, done=True))
+        return b"".join(self._stdout_chunks) if self._stdout else None
+
+    # --- output readers --------------------------------------------------
+    def _read_stderr(self):
+        for line in self._process.stderr:
+            self._stderr.append(line.decode(errors="replace").rstrip())
+
+    def _read_stdout(self):
+        for chunk in iter(lambda: self._process.stdout.read(1 << 16), b""):
+            self._stdout_chunks.append(chunk)
+
+    def _read_progress(self):
+        fields = {}
+        for line in self._process.stdout:
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            if key != "progress":
+                fields[key] = value
+                continue
+            if self.on_progress is None:
+                continue
+            self._last_progress = Progress(
+                self.description,
+                frame=_to_int(fields.get("frame")),
+                seconds=_to_int(fields.get("out_time_us")) / 1e6,
+                duration=self.duration,
+                elapsed=time.monotonic() - self._started,
+            )
+            if value != "end":
+                self._report(self._last_progress)
+
+    def _report(self, progress):
+        try:
+            self.on_progress(progress)
+        except Exception:
+            log.exception("Progress callback failed")
+
+
+def _to_int(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def run(args, description="run", duration=None, on_progress=None, cancel=None, stdout=False):
+    """Runs ffmpeg with ``args`` to completion, see :class:`FFmpegProcess`."""
+    with FFmpegProcess(args, description, duration, on_progress, cancel, stdout=stdout) as process:
+        return process.wait()
+
+
+def pipe(args, description="encode", duration=None, on_progress=None, cancel=None):
+    """Starts ffmpeg reading from stdin (``-i -`` in ``args``); feed it with ``write()`` and finish with ``wait()``."""
+    return FFmpegProcess(args, description, duration, on_progress, cancel, stdin=True)
+
+
+@lru_cache(maxsize=None)
+def version():
+    """
+    (major, minor) of the installed ffmpeg, or None if it cannot be told
+    (not installed, or a git build without a release number).
+    """
+    try:
+        output = subprocess.run([FFMPEG, "-version"], capture_output=True, text=True, check=False).stdout
+    except OSError:
+        return None
+    match = re.match(r"ffmpeg version n?(\d+)\.(\d+)", output)
+    return (int(match[1]), int(match[2])) if match else None
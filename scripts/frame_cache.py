@@ -0,0 +1,167 @@
+import sys
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from PIL import Image
+
+import tracing
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = Path(sys.executable).resolve().parent
+else:
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+FRAME_CACHE_DIR = BASE_DIR / "cache" / "frames"
+
+# Set to True (or call configure()) to look rendered frames up by the hash of their inputs
+PERSIST_FRAMES = False
+
+# The cache keeps the most recently used frames up to this size, and drops frames unused for this long
+FRAME_CACHE_MAX_BYTES = 1024 ** 3
+FRAME_CACHE_MAX_AGE = 30 * 24 * 3600
+
+# (path, mtime) -> sha1 of the file contents
+_file_digests = {}
+
+
+def configure(persist=True, cache_dir=None):
+    """Enables/disables the frame cache and optionally moves it."""
+    global PERSIST_FRAMES, FRAME_CACHE_DIR
+    PERSIST_FRAMES = persist
+    if cache_dir is not None:
+        FRAME_CACHE_DIR = Path(cache_dir)
+
+
+def settings():
+    """The current configuration, as ``configure()`` keyword arguments (for worker processes)."""
+    return {"persist": PERSIST_FRAMES, "cache_dir": FRAME_CACHE_DIR}
+
+
+def clear():
+    """Deletes every cached frame from disk."""
+    shutil.rmtree(FRAME_CACHE_DIR, ignore_errors=True)
+    _file_digests.clear()
+
+
+def file_digest(path):
+    """sha1 of the contents of ``path``, computed once per modification of the file."""
+    path = Path(path)
+    key = (str(path), path.stat().st_mtime_ns)
+    digest = _file_digests.get(key)
+    if digest is None:
+        digest = hashlib.sha1(path.read_bytes()).hexdigest()
+        _file_digests[key] = digest
+    return digest
+
+
+def frame_key(*inputs):
+    """Hashes the ``repr`` of everything a frame is drawn from into its cache key."""
+    return hashlib.sha256(repr(inputs).encode("utf8")).hexdigest()
+
+
+def _path(key):
+    return FRAME_CACHE_DIR / key[:2] / f"{key}.png"
+
+
+def contains(key):
+    """Whether ``key`` is cached, without counting a lookup or marking the frame as used."""
+    return _path(key).exists()
+
+
+def lookup(key):
+    """Returns the cached PNG of ``key``, or None."""
+    path = _path(key)
+    hit = path.exists()
+    tracing.count_lookup("frame_cache", hit)
+    if not hit:
+        return None
+    touch(path)
+    return path
+
+
+def load(path):
+    """
+    Decodes a cached frame; None if :func:`prune` (e.g. of another render job)
+    deleted it since the :func:`lookup`, which the caller treats as a miss.
+    """
+    try:
+        with Image.open(path) as image:
+            image.load()
+            return image
+    except FileNotFoundError:
+        return None
+
+
+def copy(path, output_path):
+    """Copies a cached frame to ``output_path``; False if it was pruned since the :func:`lookup`."""
+    try:
+        shutil.copyfile(path, output_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def store(key, image=None, png_file=None):
+    """Adds a frame to the cache, from an ``image`` or an already written ``png_file``."""
+    path = _path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write under a private name first: other processes may be storing the same frame
+    tmp_path = path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        if png_file is not None:
+            shutil.copyfile(png_file, tmp_path)
+        else:
+            image.save(str(tmp_path), format="PNG")
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def touch(path):
+    """Marks a cache file as just used, so :func:`prune_directory` keeps it longest."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_directory(directory, pattern, max_bytes=None, max_age=None):
+    """
+    Deletes the files of ``directory`` matching ``pattern`` that were last used
+    more than ``max_age`` seconds ago, then the least recently used ones until
+    the rest fits in ``max_bytes``. Returns the number of bytes freed.
+    Hidden files (entries still being written) are left alone.
+    """
+    entries = []
+    for path in Path(directory).rglob(pattern):
+        if path.name.startswith("."):
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+
+    now = time.time()
+    kept = freed = 0
+    for mtime, size, path in entries:
+        if (max_age is None or now - mtime <= max_age) and (max_bytes is None or kept + size <= max_bytes):
+            kept += size
+            continue
+        try:
+            path.unlink()
+            freed += size
+        except OSError:
+            pass
+    return freed
+
+
+def prune(max_bytes=None, max_age=None):
+    """Bounds the frame cache (default: ``FRAME_CACHE_MAX_BYTES`` and ``FRAME_CACHE_MAX_AGE``)."""
+    return prune_directory(FRAME_CACHE_DIR, "*.png",
+                           FRAME_CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+                           FRAME_CACHE_MAX_AGE if max_age is None else max_age)
@@ -3,21 +3,38 @@ from PIL import Image, ImageFont, ImageDraw
 from pilmoji import Pilmoji
 import datetime
 import os
-import json
+import logging
 import random
+import multiprocessing
 import regex
 import re
+import PIL
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import NamedTuple, Optional, Tuple
 
+import avatar_cache
+import emoji_store
+import frame_cache
+import tracing
+from avatar_cache import get_avatar
+from characters import get_character, get_characters
+from emoji_store import EMOJI_SOURCE
+from script_compiler import JOINED, compile_script
+from text_layout import measure, metrics
 
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtWidgets import QFileDialog
+log = logging.getLogger(__name__)
 
 # CONSTANTS
 WORLD_WIDTH = 1777
 WORLD_Y_INIT_MESSAGE = 231
 WORLD_DY = 70
-WORLD_HEIGHTS_MESSAGE = [WORLD_Y_INIT_MESSAGE + i * WORLD_DY for i in range(5)]  # Max 5 messages
+WORLD_HEIGHTS_MESSAGE = [WORLD_Y_INIT_MESSAGE + i * WORLD_DY for i in range(5)]  # First 5 rows, see Layout.block_height
+# Tallest block shown at once (16:9 of WORLD_WIDTH); longer blocks scroll their first rows out of view
+VIEWPORT_HEIGHT = 1000
 WORLD_COLOR = (54, 57, 63, 255)
 
 WORLD_HEIGHT_JOINED = 100
@@ -54,7 +71,19 @@ NAME_TIME_SPACING = 25
 MESSAGE_X = 190
 MESSAGE_Y_INIT = 115
 MESSAGE_DY = 70
-MESSAGE_POSITIONS = [(MESSAGE_X, MESSAGE_Y_INIT + i * MESSAGE_DY) for i in range(5)]
+MESSAGE_POSITIONS = [(MESSAGE_X, MESSAGE_Y_INIT + i * MESSAGE_DY) for i in range(5)]  # see Layout.message_position
+# Messages wrap onto a new row MESSAGE_DY further down before reaching this far from the right edge
+MESSAGE_RIGHT_MARGIN = 40
+MENTION_PADDING = 8
+# Emojis sit this much below the text, at 1.2 times the text size in text rows
+# and twice the text size in emoji-only messages
+EMOJI_Y_OFFSET = 8
+EMOJI_INLINE_SCALE = 1.2
+EMOJI_ONLY_SCALE = 2
+
+# Bump whenever a change to the drawing code alters the rendered frames,
+# so stale entries of the frame cache are no longer used
+RENDERER_VERSION = 6
 
 # Load fonts
 font = "whitney" # Change this according to the font you want to use
@@ -66,28 +95,149 @@ else:
     
 FONT_DIR = BASE_DIR / 'assets' / 'fonts' / font  # e.g., 'whitney'
 
+@tracing.traced("load font")
 def load_font(filename, size, name="Font"):
     path = FONT_DIR / filename
-    print(f"[{name}] Looking: {path}")
+    log.debug("[%s] Looking: %s", name, path)
     if not path.exists():
         raise FileNotFoundError(f"{name} missing: {path}")
     font = ImageFont.truetype(str(path), size)
-    print(f"[{name}] Loaded: {filename} (size {size})")
+    log.debug("[%s] Loaded: %s (size %s)", name, filename, size)
     return font
     
-# === LOAD ALL FONTS ===
-name_font = load_font('semibold.ttf', NAME_FONT_SIZE, "Name Font")
-time_font = load_font('semibold.ttf', TIME_FONT_SIZE, "Time Font")
-message_font = load_font('medium.ttf', MESSAGE_FONT_SIZE, "Message Font")
-message_italic_font = load_font('medium_italic.ttf', MESSAGE_FONT_SIZE, "Message Italic")
-message_bold_font = load_font('bold.ttf', MESSAGE_FONT_SIZE, "Message Bold")
-message_italic_bold_font = load_font('bold_italic.ttf', MESSAGE_FONT_SIZE, "Message Bold Italic")
-message_mention_font = load_font('semibold.ttf', MESSAGE_FONT_SIZE, "Mention Font")
-message_mention_italic_font = load_font('semibold_italic.ttf', MESSAGE_FONT_SIZE, "Mention Italic")
+# === FONTS (loaded lazily, once per face and size) ===
+class Fonts(NamedTuple):
+    name: ImageFont.FreeTypeFont
+    time: ImageFont.FreeTypeFont
+    message: ImageFont.FreeTypeFont
+    message_italic: ImageFont.FreeTypeFont
+    message_bold: ImageFont.FreeTypeFont
+    message_italic_bold: ImageFont.FreeTypeFont
+    message_mention: ImageFont.FreeTypeFont
+    message_mention_italic: ImageFont.FreeTypeFont
+
+
+FONT_FACES = Fonts(
+    name=('semibold.ttf', NAME_FONT_SIZE),
+    time=('semibold.ttf', TIME_FONT_SIZE),
+    message=('medium.ttf', MESSAGE_FONT_SIZE),
+    message_italic=('medium_italic.ttf', MESSAGE_FONT_SIZE),
+    message_bold=('bold.ttf', MESSAGE_FONT_SIZE),
+    message_italic_bold=('bold_italic.ttf', MESSAGE_FONT_SIZE),
+    message_mention=('semibold.ttf', MESSAGE_FONT_SIZE),
+    message_mention_italic=('semibold_italic.ttf', MESSAGE_FONT_SIZE),
+)
+
+
+@lru_cache(maxsize=None)
+def get_font(filename, size):
+    """Returns the font face ``filename`` at ``size``, loading it on first use."""
+    return load_font(filename, size, f"{filename} @ {size}")
+
+
+@lru_cache(maxsize=None)
+def fonts(scale=1.0):
+    """Returns every font used by the renderer, with sizes multiplied by ``scale``."""
+    return Fonts(*(get_font(filename, round(size * scale)) for filename, size in FONT_FACES))
+
+
+def __getattr__(attr):
+    # Backwards compatible module attributes: name_font, message_font, …, characters_dict
+    if attr.endswith("_font") and attr[:-len("_font")] in Fonts._fields:
+        return getattr(fonts(), attr[:-len("_font")])
+    if attr == "characters_dict":
+        return get_characters()
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
+
+
+class Layout(NamedTuple):
+    """
+    Pixel geometry of the frames. The layout constants above describe the
+    original 1777 px wide design; a layout scales them by ``scale`` and, when
+    ``frame_size`` is set, pads every frame to exactly that size so it can go
+    into the video as is. The default layout draws the original design.
+    """
+    scale: float = 1.0
+    frame_size: Optional[Tuple[int, int]] = None
+
+    def px(self, value):
+        """Scales a length of the original design."""
+        return round(value * self.scale)
+
+    @property
+    def width(self):
+        return self.px(WORLD_WIDTH)
+
+    @property
+    def joined_height(self):
+        return self.px(WORLD_HEIGHT_JOINED)
+
+    @property
+    def viewport_height(self):
+        """Tallest block image; the frame height when the layout has a frame size."""
+        return self.frame_size[1] if self.frame_size is not None else self.px(VIEWPORT_HEIGHT)
+
+    @property
+    def message_width(self):
+        """Room for a row of message text before it wraps."""
+        return self.px(WORLD_WIDTH - MESSAGE_X - MESSAGE_RIGHT_MARGIN)
+
+    def block_height(self, i):
+        """Height of a block of i + 1 messages, before emoji and wrapped rows."""
+        return self.px(WORLD_Y_INIT_MESSAGE + i * WORLD_DY)
+
+    def message_position(self, i):
+        return self.px(MESSAGE_X), self.px(MESSAGE_Y_INIT + i * MESSAGE_DY)
+
+    def fonts(self):
+        return fonts(self.scale)
+
+    def compose(self, image):
+        """
+        Returns ``image`` centred on a black ``frame_size`` canvas (scaled down
+        first if it does not fit), like ffmpeg's scale+pad did; unchanged if
+        the layout has no frame size.
+        """
+        if self.frame_size is None:
+            return image
+        width, height = self.frame_size
+        if image.width > width or image.height > height:
+            fit = min(width / image.width, height / image.height)
+            image = image.resize((max(1, round(image.width * fit)), max(1, round(image.height * fit))),
+                                 Image.BICUBIC)
+        frame = Image.new("RGBA", self.frame_size, (0, 0, 0, 255))
+        frame.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+        return frame
+
+    def uncompose(self, frame, block_size):
+        """
+        Cuts a block of ``block_size`` back out of a frame made by :meth:`compose`.
+        Returns None if the block had to be scaled down to fit.
+        """
+        if self.frame_size is None:
+            return frame
+        width, height = self.frame_size
+        if block_size[0] > width or block_size[1] > height:
+            return None
+        left, top = (width - block_size[0]) // 2, (height - block_size[1]) // 2
+        return frame.crop((left, top, left + block_size[0], top + block_size[1]))
 
-# Load profile picture dictionary
-with open(BASE_DIR / 'assets' / 'profile_pictures' / 'characters.json', encoding="utf8") as file:
-    characters_dict = json.load(file)
+
+DEFAULT_LAYOUT = Layout()
+
+# Joined rows kept rendered per process, keyed by name, time, template, arrow offset, colour and layout
+JOINED_ROW_CACHE_SIZE = 512
+# Last joined stack drawn by this process: (row keys, layout, image). The image is
+# a private copy, never handed out, so callers (and render-service threads) cannot change it
+_last_joined_stack = None
+
+
+def layout_for(size=None):
+    """Layout whose frames are ``size`` (width, height) pixels; the original design for None."""
+    if size is None:
+        return DEFAULT_LAYOUT
+    width, height = size
+    return Layout(scale=width / WORLD_WIDTH, frame_size=(width, height))
 
 
 def is_emoji_message(message):
@@ -95,182 +245,387 @@ def is_emoji_message(message):
     return bool(message) and all(regex.match(r'^\p{Emoji}+$', char) for char in message.strip())
 
 
-def generate_chat(messages, name_time, profpic_file, color):
+def emoji_offset(font, text, dy):
+    """Pilmoji ``emoji_position_offset`` that draws the emojis of ``text`` ``dy`` below the top of the line."""
+    return 0, dy - emoji_store.emoji_shift(font, text)
+
+
+def generate_chat(messages, name_time, profpic_file, color, layout=DEFAULT_LAYOUT):
     """
     Generates a chat image given the list of messages, name & time info,
     profile picture file, and a role color.
     """
-    name_text = name_time[0]
-    time_text = f'Today at {name_time[1]} PM'
-    
-    # Calculate baseline-aligned time position
-    name_ascent, _ = name_font.getmetrics()
-    time_ascent, _ = time_font.getmetrics()
-    baseline_y = NAME_POSITION[1] + name_ascent
-    time_position = (
-        NAME_POSITION[0] + name_font.getbbox(name_text)[2] + NAME_TIME_SPACING,
-        baseline_y - time_ascent
-    )
-    
-    # Open and process profile picture
-    prof_pic = Image.open(profpic_file)
-    #prof_pic.thumbnail((sys.maxsize, PROFPIC_WIDTH), Image.ANTIALIAS) 
-    prof_pic.thumbnail((sys.maxsize, PROFPIC_WIDTH), Image.LANCZOS) 
-    mask = Image.new("L", prof_pic.size, 0)
-    ImageDraw.Draw(mask).ellipse([(0, 0), (PROFPIC_WIDTH, PROFPIC_WIDTH)], fill=255)
-    
-    # Adjust vertical size for emoji-only messages
-    y_increment = 0
-    for msg in messages:
-        if is_emoji_message(msg):
-            bbox = message_font.getbbox("💀")
-            y_increment += (bbox[3] - bbox[1]) + 8
-
-    total_height = WORLD_HEIGHTS_MESSAGE[len(messages) - 1] + y_increment
-    template = Image.new(mode='RGBA', size=(WORLD_WIDTH, total_height), color=WORLD_COLOR)
-    template.paste(prof_pic, PROFPIC_POSITION, mask)
-    draw_template = ImageDraw.Draw(template)
-    
-    draw_template.text(NAME_POSITION, name_text, color, font=name_font)
-    draw_template.text(time_position, time_text, TIME_FONT_COLOR, font=time_font)
+    renderer = BlockRenderer(name_time, profpic_file, color, layout)
+    for message in messages:
+        renderer.add_message(message)
+    return renderer.image
+
+
+class TextRun(NamedTuple):
+    """A piece of message text drawn in one font; mentions get a pill behind them."""
+    text: str
+    font: ImageFont.FreeTypeFont
+    mention: bool = False
+
+
+def message_runs(message, font_set):
+    """Splits ``message`` into runs by its bold (**), italic (__) and mention (@name) markup."""
+    runs = []
+    # Tokenize for bold (**), italic (__), and mentions (@...)
+    tokens = re.split(r'(\*\*|__)', message)
+    bold = italic = False
+    for token in tokens:
+        if token == '**':
+            bold = not bold
+        elif token == '__':
+            italic = not italic
+        elif token:
+            # Split further by mentions
+            for part in re.split(r'(@\w+)', token):
+                if not part:
+                    continue
+                if part.startswith('@'):
+                    # Mentions are always semibold
+                    font_used = font_set.message_mention_italic if italic else font_set.message_mention
+                    runs.append(TextRun(part, font_used, mention=True))
+                else:
+                    if bold and italic:
+                        font_used = font_set.message_italic_bold
+                    elif bold:
+                        font_used = font_set.message_bold
+                    elif italic:
+                        font_used = font_set.message_italic
+                    else:
+                        font_used = font_set.message
+                    runs.append(TextRun(part, font_used))
+    return runs
+
+
+def run_width(run, padding):
+    """Horizontal room taken by ``run``, including the pill padding of a mention."""
+    width = measure(run.font, run.text).width
+    return width + 2 * padding if run.mention else width
+
+
+def wrap_runs(runs, max_width, padding):
+    """
+    Breaks ``runs`` into rows no wider than ``max_width``, between words. A word
+    wider than a whole row gets a row of its own; mentions never break. Each
+    run keeps its own pieces, so a message that fits stays exactly its runs.
+    """
+    rows = [[]]
+    for run_no, run in enumerate(runs):
+        words = [run.text] if run.mention else (re.findall(r'\s*\S+\s*', run.text) or [run.text])
+        for word in words:
+            row = rows[-1]
+            if row and row[-1][0] == run_no:
+                candidate = row[:-1] + [(run_no, row[-1][1] + word)]
+            else:
+                candidate = row + [(run_no, word)]
+            width = sum(run_width(runs[n]._replace(text=text), padding) for n, text in candidate[:-1])
+            width += run_width(runs[run_no]._replace(text=candidate[-1][1].rstrip() or word), padding)
+            if row and width > max_width:
+                candidate = [(run_no, word.lstrip() or word)]
+                rows.append(candidate)
+            else:
+                rows[-1] = candidate
+    return [[runs[n]._replace(text=text) for n, text in row] for row in rows]
 
-    y_offset = 0
-    for i, message in enumerate(messages):
+
+class BlockRenderer:
+    """
+    Renders a speaker's message block one line at a time.
+
+    Every :meth:`add_message` call pastes the previous canvas onto a new one
+    and draws only the new line, so a block of N lines costs N line draws
+    instead of N². Row offsets are computed as the block grows, long
+    messages wrap onto extra rows, and the canvas never gets taller than
+    :attr:`Layout.viewport_height`: past that, the first rows scroll out of
+    view, so each frame costs the same however long the block gets. The
+    returned images are reused as the base of the next frame and must not be
+    modified by the caller. With ``sprites`` (an
+    :class:`emoji_store.SpriteSnapshot`), emojis are drawn as that snapshot has them.
+    """
+
+    def __init__(self, name_time, profpic_file, color, layout=DEFAULT_LAYOUT, sprites=None):
+        self.name_time = name_time
+        self.profpic_file = profpic_file
+        self.color = color
+        self.layout = layout
+        self.emoji_source = EMOJI_SOURCE if sprites is None else emoji_store.LocalEmojiSource(sprites)
+        self._reset()
+
+    def _reset(self):
+        self.messages = ()
+        self.image = None
+        self.y_increment = 0  # extra canvas height taken by emoji-only and wrapped messages
+        self.y_offset = 0     # extra drawing offset taken by emoji-only and wrapped messages
+        self._load_frame = None
+
+    @property
+    def full_height(self):
+        """Height of the whole block, including the rows scrolled out of view."""
+        return self.layout.block_height(len(self.messages) - 1) + self.y_increment
+
+    @property
+    def scroll(self):
+        """Rows of pixels scrolled out of view at the top of the block."""
+        return max(0, self.full_height - self.layout.viewport_height)
+
+    @property
+    def size(self):
+        """Size of the block image for the current messages."""
+        return self.layout.width, self.full_height - self.scroll
+
+    def resume(self, messages, load_frame):
+        """
+        Continues the block from an already rendered frame of ``messages``
+        without drawing it. ``load_frame()`` is only called to get that frame
+        once another message is added; it may return None if the frame
+        is gone, and the block is then drawn again.
+        """
+        self._reset()
+        for message in messages:
+            self.messages += (message,)
+            _, extra = self._layout_message(message)
+            self.y_increment += extra
+            self.y_offset += extra
+        self._load_frame = load_frame
+
+    def render(self, messages):
+        """Returns the image for ``messages``, extending the current block when possible."""
+        messages = tuple(messages)
+        if messages[:-1] != self.messages:
+            self._reset()
+            for message in messages[:-1]:
+                self.add_message(message)
+        return self.add_message(messages[-1])
+
+    def _emoji_row_extra(self):
+        """How much taller than a text row an emoji-only row is."""
+        layout = self.layout
+        emoji_size = int(EMOJI_ONLY_SCALE * layout.fonts().message.size)
+        return max(0, layout.px(EMOJI_Y_OFFSET) + emoji_size - layout.px(MESSAGE_DY))
+
+    @tracing.traced("text layout")
+    def _layout_message(self, message):
+        """
+        Returns (rows, extra height) for ``message``: rows are its wrapped text
+        runs, None for emoji-only messages, and the extra height is how much
+        taller than one text row it is. It both grows the block and moves the
+        next message down, so the last row always fits in the block.
+        """
+        layout = self.layout
+        font_set = layout.fonts()
+        text = message.strip()
+        if is_emoji_message(message):
+            # Emoji-only messages are drawn larger, on a taller row
+            return None, self._emoji_row_extra()
+        rows = wrap_runs(message_runs(text, font_set), layout.message_width, layout.px(MENTION_PADDING))
+        return rows, (len(rows) - 1) * layout.px(MESSAGE_DY)
+
+    def add_message(self, message):
+        """Draws ``message`` below the previous ones and returns the new block image."""
+        if self._load_frame is not None:
+            frame = self._load_frame()
+            self.image = self.layout.uncompose(frame, self.size) if frame is not None else None
+            self._load_frame = None
+            if self.image is None:
+                # The cached frame is gone or cannot give the block back: draw it again
+                self.image = self.redraw()
+
+        i = len(self.messages)
+        previous_scroll = self.scroll
+        self.messages += (message,)
+        rows, extra = self._layout_message(message)
+        self.y_increment += extra
+
+        template = Image.new(mode='RGBA', size=self.size, color=WORLD_COLOR)
+        if self.image is None:
+            self._draw_header(template)
+        else:
+            template.paste(self.image, (0, previous_scroll - self.scroll))
+        self.image = template
+
+        self._draw_message(template, message, rows, i)
+        self.y_offset += extra
+        return template
+
+    def redraw(self):
+        """
+        Draws the current messages from scratch on a new canvas and returns it.
+        :meth:`add_message` gives the same pixels by drawing only the new line.
+        """
+        template = Image.new(mode='RGBA', size=self.size, color=WORLD_COLOR)
+        self._draw_header(template)
+        final_offset, self.y_offset = self.y_offset, 0
+        try:
+            for i, message in enumerate(self.messages):
+                rows, extra = self._layout_message(message)
+                self._draw_message(template, message, rows, i)
+                self.y_offset += extra
+        finally:
+            self.y_offset = final_offset
+        return template
+
+    def _draw_header(self, template):
+        layout = self.layout
+        font_set = layout.fonts()
+        name_text = self.name_time[0]
+        time_text = f'Today at {self.name_time[1]} PM'
+        name_position = (layout.px(NAME_POSITION[0]), layout.px(NAME_POSITION[1]) - self.scroll)
+
+        # Calculate baseline-aligned time position
+        name_ascent, _ = metrics(font_set.name)
+        time_ascent, _ = metrics(font_set.time)
+        baseline_y = name_position[1] + name_ascent
+        time_position = (
+            name_position[0] + measure(font_set.name, name_text).bbox[2] + layout.px(NAME_TIME_SPACING),
+            baseline_y - time_ascent
+        )
+
+        # Circular avatar, decoded and resized once per character
+        avatar = get_avatar(name_text, self.profpic_file, layout.px(PROFPIC_WIDTH))
+        template.paste(avatar, (layout.px(PROFPIC_POSITION[0]), layout.px(PROFPIC_POSITION[1]) - self.scroll), avatar)
+        draw_template = ImageDraw.Draw(template)
+        draw_template.text(name_position, name_text, self.color, font=font_set.name)
+        draw_template.text(time_position, time_text, TIME_FONT_COLOR, font=font_set.time)
+
+    @tracing.traced("draw text")
+    def _draw_message(self, template, message, rows, i):
+        """Draws the i-th message of the block, laid out as ``rows`` by :meth:`_layout_message`."""
+        layout = self.layout
+        font_set = layout.fonts()
+        draw_template = ImageDraw.Draw(template)
         message = message.strip()
         if not message:
-            continue
+            return
 
-        x, base_y = MESSAGE_POSITIONS[i]
-        y_pos = base_y + y_offset
-        current_x = x
+        x, base_y = layout.message_position(i)
+        y_pos = base_y + self.y_offset - self.scroll
 
-        if is_emoji_message(message):
-            with Pilmoji(template) as pilmoji:
-                pilmoji.text((current_x, y_pos), message, MESSAGE_FONT_COLOR, font=message_font,
-                             emoji_position_offset=(0, 8), emoji_scale_factor=2)
-            y_offset += message_font.getbbox(message)[3]
-            continue
-
-        # Tokenize for bold (**), italic (__), and mentions (@...)
-        tokens = re.split(r'(\*\*|__)', message)
-        bold = italic = False
-        with Pilmoji(template) as pilmoji:
-            for token in tokens:
-                if token == '**':
-                    bold = not bold
-                elif token == '__':
-                    italic = not italic
-                else:
-                    if not token:
-                        continue
-                    # Split further by mentions
-                    parts = re.split(r'(@\w+)', token)
-                    for part in parts:
-                        if not part:
-                            continue
-                        if part.startswith('@'):
-                            # Choose font for mentions (mentions are always semibold)
-                            if bold and italic:
-                                font_used = message_mention_italic_font
-                            elif bold:
-                                font_used = message_mention_font
-                            elif italic:
-                                font_used = message_mention_italic_font
-                            else:
-                                font_used = message_mention_font
-
-                            bbox = font_used.getbbox(part)
-                            text_width = bbox[2] - bbox[0]
-                            text_top = bbox[1]
-                            text_bottom = bbox[3]
-                            padding = 8
-                            bg_box = [
-                                current_x,
-                                y_pos + text_top - padding,
-                                current_x + text_width + 2 * padding,
-                                y_pos + text_bottom + padding
-                            ]
-                            draw_template.rounded_rectangle(bg_box, fill=(74, 75, 114), radius=10)
-                            pilmoji.text((current_x + padding, y_pos), part, (201, 205, 251), font=font_used)
-                            current_x += text_width + 2 * padding
-                        else:
-                            # Determine proper font for regular text
-                            if bold and italic:
-                                font_used = message_italic_bold_font
-                            elif bold:
-                                font_used = message_bold_font
-                            elif italic:
-                                font_used = message_italic_font
-                            else:
-                                font_used = message_font
-                            pilmoji.text((current_x, y_pos), part, MESSAGE_FONT_COLOR, font=font_used,
-                                         emoji_position_offset=(0, 8), emoji_scale_factor=1.2)
-                            current_x += font_used.getbbox(part)[2] - font_used.getbbox(part)[0]
-    return template
-
-
-def generate_joined_message(name, time, template_str, arrow_x, color=NAME_FONT_COLOR):
+        if rows is None:
+            with Pilmoji(template, source=self.emoji_source) as pilmoji:
+                pilmoji.text((x, y_pos), message, MESSAGE_FONT_COLOR, font=font_set.message,
+                             emoji_position_offset=emoji_offset(font_set.message, message, layout.px(EMOJI_Y_OFFSET)),
+                             emoji_scale_factor=EMOJI_ONLY_SCALE)
+            return
+
+        padding = layout.px(MENTION_PADDING)
+        with Pilmoji(template, source=self.emoji_source) as pilmoji:
+            for row in rows:
+                current_x = x
+                for run in row:
+                    if run.mention:
+                        bbox = measure(run.font, run.text).bbox
+                        bg_box = [
+                            current_x,
+                            y_pos + bbox[1] - padding,
+                            current_x + run_width(run, padding),
+                            y_pos + bbox[3] + padding
+                        ]
+                        draw_template.rounded_rectangle(bg_box, fill=(74, 75, 114), radius=layout.px(10))
+                        pilmoji.text((current_x + padding, y_pos), run.text, (201, 205, 251), font=run.font,
+                                     emoji_position_offset=emoji_offset(run.font, run.text, 0))
+                    else:
+                        pilmoji.text((current_x, y_pos), run.text, MESSAGE_FONT_COLOR, font=run.font,
+                                     emoji_position_offset=emoji_offset(run.font, run.text, layout.px(EMOJI_Y_OFFSET)),
+                                     emoji_scale_factor=EMOJI_INLINE_SCALE)
+                    current_x += run_width(run, padding)
+                y_pos += layout.px(MESSAGE_DY)
+
+
+@lru_cache(maxsize=None)
+def arrow_sprite(size):
+    """The green arrow of joined messages, decoded once per process and thumbnailed to ``size`` pixels."""
+    arrow = Image.open(BASE_DIR / 'assets' / 'green_arrow.png')
+    arrow.thumbnail((size, size))
+    return arrow
+
+
+def generate_joined_message(name, time, template_str, arrow_x, color=NAME_FONT_COLOR, layout=DEFAULT_LAYOUT):
     """
     Generates a Discord-like joined message with a green arrow.
     The character name will be colored with their role color.
     """
+    return _joined_row(name, time, template_str, arrow_x, color, layout).copy()
+
+
+@lru_cache(maxsize=JOINED_ROW_CACHE_SIZE)
+def _joined_row(name, time, template_str, arrow_x, color, layout):
+    # Shared between frames: paste it, never draw on it
     before_text, after_text = template_str.split("CHARACTER", 1) if "CHARACTER" in template_str else ("", "")
     time_text = f'Today at {time} PM'
+    font_set = layout.fonts()
     
-    template_img = Image.new(mode='RGBA', size=(WORLD_WIDTH, WORLD_HEIGHT_JOINED), color=WORLD_COLOR)
+    template_img = Image.new(mode='RGBA', size=(layout.width, layout.joined_height), color=WORLD_COLOR)
     draw_template = ImageDraw.Draw(template_img)
     
-    arrow = Image.open(BASE_DIR / 'assets' / 'green_arrow.png')
-    arrow.thumbnail((40, 40))
-    text_x = arrow_x + arrow.width + 60
+    arrow = arrow_sprite(layout.px(40))
+    arrow_x = layout.px(arrow_x)
+    text_x = arrow_x + arrow.width + layout.px(60)
 
-    text_bbox = message_font.getbbox("Sample")
+    text_bbox = measure(font_set.message, "Sample").bbox
     text_height = text_bbox[3] - text_bbox[1]
-    text_y = (WORLD_HEIGHT_JOINED - text_height) // 2
-    message_ascent, message_descent = message_font.getmetrics()
+    text_y = (layout.joined_height - text_height) // 2
+    message_ascent, message_descent = metrics(font_set.message)
     total_text_height = message_ascent + message_descent
     arrow_y = text_y + (total_text_height - arrow.height) // 2
 
     template_img.paste(arrow, (arrow_x, arrow_y), arrow)
     
-    before_width = message_font.getbbox(before_text)[2] if before_text else 0
-    name_width = name_font.getbbox(name)[2]
-    with Pilmoji(template_img) as pilmoji:
+    before_width = measure(font_set.message, before_text).bbox[2] if before_text else 0
+    name_width = measure(font_set.name, name).bbox[2]
+    with Pilmoji(template_img, source=EMOJI_SOURCE) as pilmoji:
         if before_text:
-            pilmoji.text((text_x, text_y), before_text, JOINED_FONT_COLOR, font=message_font)
+            pilmoji.text((text_x, text_y), before_text, JOINED_FONT_COLOR, font=font_set.message)
         name_x = text_x + before_width
-        pilmoji.text((name_x, text_y), name, color, font=name_font)
+        pilmoji.text((name_x, text_y), name, color, font=font_set.name)
         if after_text:
             after_x = name_x + name_width
-            pilmoji.text((after_x, text_y), after_text, JOINED_FONT_COLOR, font=message_font)
+            pilmoji.text((after_x, text_y), after_text, JOINED_FONT_COLOR, font=font_set.message)
         
-        total_msg_width = before_width + name_width + message_font.getbbox(after_text)[2]
-        time_x = text_x + total_msg_width + 30
+        total_msg_width = before_width + name_width + measure(font_set.message, after_text).bbox[2]
+        time_x = text_x + total_msg_width + layout.px(30)
         time_baseline = text_y + message_ascent
-        time_y = time_baseline - time_font.getmetrics()[0]
-        pilmoji.text((time_x, time_y), time_text, TIME_FONT_COLOR, font=time_font)
+        time_y = time_baseline - metrics(font_set.time)[0]
+        pilmoji.text((time_x, time_y), time_text, TIME_FONT_COLOR, font=font_set.time)
     
     return template_img
 
 
-def generate_joined_message_stack(joined_messages, hour):
+@tracing.traced("joined stack")
+def generate_joined_message_stack(rows, hour, layout=DEFAULT_LAYOUT):
     """
     Generates a stacked image for multiple joined messages.
+    ``rows`` holds one (name, template_str, arrow_x, joined_time) tuple per joined message.
+    Rows come from the row cache, and a stack that only adds rows below the
+    previous one starts from that image, so each new frame draws one row.
     """
-    total_height = WORLD_HEIGHT_JOINED * len(joined_messages)
-    template_img = Image.new(mode='RGBA', size=(WORLD_WIDTH, total_height), color=WORLD_COLOR)
-    
-    for idx, key in enumerate(joined_messages):
-        name = key.split(' ')[1].split('$^')[0]
-        color = characters_dict[name]["role_color"]
-        time_str = f'{hour}:{joined_messages[key][2].minute:02d}'
-        joined_img = generate_joined_message(name, time_str, joined_messages[key][0], joined_messages[key][1], color)
-        template_img.paste(joined_img, (0, idx * WORLD_HEIGHT_JOINED))
-    
+    global _last_joined_stack
+    row_keys = tuple(
+        (name, f'{hour}:{joined_time.minute:02d}', template_str, arrow_x, get_character(name)["role_color"])
+        for name, template_str, arrow_x, joined_time in rows
+    )
+    total_height = layout.joined_height * len(rows)
+    template_img = Image.new(mode='RGBA', size=(layout.width, total_height), color=WORLD_COLOR)
+
+    start = 0
+    last = _last_joined_stack
+    if last is not None and last[1] == layout and row_keys[:len(last[0])] == last[0]:
+        template_img.paste(last[2], (0, 0))
+        start = len(last[0])
+    for idx in range(start, len(row_keys)):
+        template_img.paste(_joined_row(*row_keys[idx], layout), (0, idx * layout.joined_height))
+
+    _last_joined_stack = (row_keys, layout, template_img.copy())
     return template_img
 
 
 def get_filename():
+    # Qt is only needed by the GUI; headless renders never import it
+    from PyQt5.QtWidgets import QApplication, QFileDialog
+
     app = QApplication(sys.argv)
     options = QFileDialog.Options()
     filename, _ = QFileDialog.getOpenFileName(
@@ -280,62 +635,427 @@ def get_filename():
     return filename
 
 
-def save_images(lines, init_time, dt=30):
-    CHAT_DIR = BASE_DIR / "chat"
-    CHAT_DIR.mkdir(exist_ok=True)
-
-    name_up_next = True
-    current_time = init_time
-    current_name = None
-    current_lines = []
-    msg_number = 1
-    joined_messages = {}
-    name_time = []
-
-    for line in lines:
-        if line == '':
-            name_up_next = True
-            current_lines = []
-            name_time = []
-            joined_messages = {}
-            continue
-
-        if line.startswith('#'):
-            joined_messages = {}
-            continue
-
-        if line.startswith("WELCOME "):
-            joined_messages[line] = [random.choice(JOINED_TEXTS), random.randint(50, 80), current_time]
-            hour = current_time.hour % 12 or 12
-            image = generate_joined_message_stack(joined_messages, hour)
-            output_path = CHAT_DIR / f"{msg_number:03d}.png"
-            image.save(str(output_path))
-            current_time += datetime.timedelta(seconds=dt)
-            msg_number += 1
-            continue
+class MessageFrameSpec(NamedTuple):
+    """Everything needed to render one frame of a speaker's block."""
+    index: int
+    name_time: Tuple[str, str]
+    profpic_file: str
+    color: str
+    messages: Tuple[str, ...]
+
+
+class JoinedFrameSpec(NamedTuple):
+    """Everything needed to render one frame of stacked joined messages."""
+    index: int
+    hour: int
+    rows: Tuple[Tuple[str, str, int, datetime.datetime], ...]
+
+
+def plan_frames(timeline, init_time, dt=30, rng=random):
+    """
+    Resolves timestamps, profile pictures and the random joined-message choices
+    of every timeline frame, in timeline order. The returned specs depend on
+    nothing else, so they can be rendered in any order or process.
+    """
+    specs = []
+    joined_choices = {}
+    characters = get_characters()
+    for frame in timeline.frames:
+        if frame.kind == JOINED:
+            current_time = init_time + datetime.timedelta(seconds=dt * frame.index)
+            joined_choices[frame.index] = (rng.choice(JOINED_TEXTS), rng.randint(50, 80))
+            rows = []
+            for offset, name in enumerate(frame.runs):
+                row_index = frame.block_start + offset
+                row_time = init_time + datetime.timedelta(seconds=dt * row_index)
+                rows.append((name, *joined_choices[row_index], row_time))
+            specs.append(JoinedFrameSpec(frame.index, current_time.hour % 12 or 12, tuple(rows)))
+        else:
+            block_time = init_time + datetime.timedelta(seconds=dt * frame.block_start)
+            block_hour = block_time.hour % 12 or 12
+            profile_pic_name = characters[frame.speaker]["profile_pic"]  # e.g. "perm/sana.jpeg"
+            specs.append(MessageFrameSpec(
+                index=frame.index,
+                name_time=(frame.speaker, f'{block_hour}:{block_time.minute:02d}'),
+                profpic_file=str(BASE_DIR / 'assets' / 'profile_pictures' / profile_pic_name),
+                color=characters[frame.speaker]["role_color"],
+                messages=frame.runs,
+            ))
+    return specs
+
+
+def group_frame_specs(specs):
+    """
+    Splits specs into jobs of consecutive frames sharing a block, so a job
+    can reuse its block canvas from one frame to the next.
+    """
+    jobs = []
+    last_key = None
+    for spec in specs:
+        if isinstance(spec, JoinedFrameSpec):
+            key = None
+        else:
+            key = spec.name_time
+        if jobs and key is not None and key == last_key:
+            jobs[-1].append(spec)
         else:
-            joined_messages = {}
-
-        if name_up_next:
-            current_name = line.split(':')[0]
-            hour = current_time.hour % 12 or 12
-            name_time = [current_name, f'{hour}:{current_time.minute:02d}']
-            name_up_next = False
-            continue
-
-        current_lines.append(line.split('$^')[0])
-        profile_pic_name = characters_dict[current_name]["profile_pic"]  # e.g. "perm/sana.jpeg"
-        profpic_file = BASE_DIR / 'assets' / 'profile_pictures' / profile_pic_name
-        image = generate_chat(
-            messages=current_lines,
-            name_time=name_time,
-            profpic_file=profpic_file,
-            color=characters_dict[current_name]["role_color"]
+            jobs.append([spec])
+        last_key = key
+    return jobs
+
+
+def frame_key(spec, layout=DEFAULT_LAYOUT, sprites=None):
+    """
+    Hash of everything the image of ``spec`` is drawn from: its text, colors,
+    timestamps, layout, fonts, emoji sprites, avatar or arrow file, Pillow and
+    renderer versions. Two specs with the same key give identical images.
+    Pass the :class:`emoji_store.SpriteSnapshot` the frame is drawn with, so the
+    key names the sprites that are actually drawn.
+    """
+    common = (RENDERER_VERSION, PIL.__version__, tuple(layout), str(FONT_DIR), tuple(FONT_FACES))
+    if isinstance(spec, JoinedFrameSpec):
+        rows = tuple(
+            (name, template_str, arrow_x, f'{spec.hour}:{joined_time.minute:02d}', get_character(name)["role_color"])
+            for name, template_str, arrow_x, joined_time in spec.rows
         )
-        output_path = CHAT_DIR / f"{msg_number:03d}.png"
-        image.save(str(output_path))
-        current_time += datetime.timedelta(seconds=dt)
-        msg_number += 1
+        arrow = frame_cache.file_digest(BASE_DIR / 'assets' / 'green_arrow.png')
+        return frame_cache.frame_key("joined", common, rows, arrow)
+    avatar = frame_cache.file_digest(spec.profpic_file)
+    return frame_cache.frame_key("message", common, spec.name_time, spec.color, spec.messages, avatar,
+                                 emoji_digests(spec.messages, sprites))
+
+
+def emoji_digests(messages, sprites=None):
+    """
+    (emoji, digest) for every emoji of ``messages``, so frames are drawn again
+    when a sprite is added or changed. The digest is that of the image drawn
+    for the emoji: its sprite in ``sprites``, or its fallback drawing.
+    """
+    if sprites is None:
+        sprites = emoji_store.SpriteSnapshot()
+    return tuple((emoji, sprites.digest(emoji)) for emoji in emoji_store.find_emojis(messages))
+
+
+def _init_worker(avatar_settings, frame_settings, emoji_dir, trace_settings):
+    # Spawned workers start from a fresh import: carry over the parent's cache settings
+    avatar_cache.configure(**avatar_settings)
+    frame_cache.configure(**frame_settings)
+    emoji_store.EMOJI_DIR = emoji_dir
+    tracing.configure(**trace_settings)
+
+
+# Rendering jobs each pool worker may have in flight ahead of the consumer of iter_images()
+JOBS_AHEAD_PER_WORKER = 2
+
+
+def _process_pool(workers):
+    # "spawn" children do not inherit open pipes (e.g. ffmpeg's stdin while
+    # streaming), which forked ones would keep open forever.
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+        initargs=({"persist": avatar_cache.PERSIST_AVATARS, "cache_dir": avatar_cache.AVATAR_CACHE_DIR},
+                  frame_cache.settings(), emoji_store.EMOJI_DIR, tracing.settings()),
+    )
+
+
+class RenderedFrame(NamedTuple):
+    spec: object
+    image: object   # None for a cached frame that was not decoded
+    key: str        # frame cache key, None when the cache is off
+    cached: Path    # PNG of the frame in the frame cache, None if it had to be drawn
+
+
+def iter_rendered(specs, decode=True, layout=DEFAULT_LAYOUT, sprites=None, keys=None):
+    """
+    Renders ``specs`` in order with ``layout``, yielding a :class:`RenderedFrame` per spec.
+    When the frame cache is on, frames found in it are not drawn; they are
+    only decoded if ``decode`` is set or a later frame of their block needs them.
+    Keys and drawings use one :class:`emoji_store.SpriteSnapshot` (``sprites``
+    or a new one), so a sprite seeded meanwhile is not stored under the wrong key.
+    ``keys`` are the frame keys of ``specs`` if the caller already computed them with ``sprites``.
+    """
+    if sprites is None:
+        sprites = emoji_store.SpriteSnapshot()
+    renderer = None
+    for i, spec in enumerate(specs):
+        with tracing.span("render frame", index=spec.index):
+            if keys is not None:
+                key = keys[i]
+            else:
+                key = frame_key(spec, layout, sprites) if frame_cache.PERSIST_FRAMES else None
+            cached = frame_cache.lookup(key) if key is not None else None
+            image = None
+            if cached is not None and decode:
+                image = frame_cache.load(cached)
+                if image is None:
+                    cached = None
+
+            if isinstance(spec, JoinedFrameSpec):
+                if cached is None:
+                    image = layout.compose(generate_joined_message_stack(spec.rows, spec.hour, layout))
+            else:
+                # Keep one renderer per block so each frame only draws its new line
+                if renderer is None or renderer.name_time != spec.name_time:
+                    renderer = BlockRenderer(spec.name_time, spec.profpic_file, spec.color, layout, sprites)
+                if cached is None:
+                    image = layout.compose(renderer.render(spec.messages))
+                elif image is not None:
+                    renderer.resume(spec.messages, lambda image=image: image)
+                else:
+                    renderer.resume(spec.messages, lambda cached=cached: frame_cache.load(cached))
+        yield RenderedFrame(spec, image, key, cached)
+
+
+class HistoryFrame(NamedTuple):
+    """
+    One frame of the full-history view. ``canvas`` is ``scroll`` pixels taller
+    than the viewport: its top shows the previous frame, its bottom this one.
+    """
+    spec: object
+    canvas: object
+    scroll: int
+    layout: Layout
+
+    def view(self, offset=None):
+        """The frame scrolled ``offset`` pixels past the previous one (default: all the way)."""
+        offset = self.scroll if offset is None else offset
+        width, height = self.canvas.width, self.canvas.height - self.scroll
+        return self.layout.compose(self.canvas.crop((0, offset, width, offset + height)))
+
+
+class HistoryRenderer:
+    """
+    Renders frames that keep the whole conversation on screen, like a Discord
+    channel: finished blocks stay above the current one and scroll up as new
+    messages arrive. Only the bottom ``Layout.viewport_height`` pixels of the
+    finished blocks are kept, in a strip that each finished block is pasted
+    onto once; a frame pastes that strip and the current block, so its cost
+    does not depend on how long the conversation already is. Frames depend
+    on everything before them, so they are rendered in order, in one process,
+    and bypass the frame cache.
+    """
+
+    def __init__(self, layout=DEFAULT_LAYOUT):
+        self.layout = layout
+        self.strip = Image.new(mode='RGBA', size=(layout.width, layout.viewport_height), color=WORLD_COLOR)
+        self.block = None           # image of the current block (its last viewport_height rows)
+        self.block_height = 0       # full height of the current block
+        self._view = self.strip     # last frame, before composing
+        self._renderer = None
+        self._joined_rows = None
+
+    def _finish_block(self):
+        if self.block is None:
+            return
+        height = self.layout.viewport_height
+        strip = Image.new(mode='RGBA', size=(self.layout.width, height), color=WORLD_COLOR)
+        strip.paste(self.strip, (0, -self.block.height))
+        strip.paste(self.block, (0, height - self.block.height))
+        self.strip = strip
+        self.block = None
+        self.block_height = 0
+
+    @tracing.traced("render frame")
+    def render(self, spec):
+        """Adds the message (or joined row) of ``spec`` and returns its :class:`HistoryFrame`."""
+        layout = self.layout
+        previous_height = self.block_height
+        if isinstance(spec, JoinedFrameSpec):
+            if self._joined_rows is None or spec.rows[:-1] != self._joined_rows:
+                self._finish_block()
+                previous_height = 0
+            self._renderer = None
+            self._joined_rows = spec.rows
+            block = generate_joined_message_stack(spec.rows, spec.hour, layout)
+            self.block_height = block.height
+            if block.height > layout.viewport_height:
+                block = block.crop((0, block.height - layout.viewport_height, block.width, block.height))
+        else:
+            renderer = self._renderer
+            if renderer is None or renderer.name_time != spec.name_time or spec.messages[:-1] != renderer.messages:
+                self._finish_block()
+                previous_height = 0
+                renderer = self._renderer = BlockRenderer(spec.name_time, spec.profpic_file, spec.color, layout)
+            self._joined_rows = None
+            block = renderer.render(spec.messages)
+            self.block_height = renderer.full_height
+        self.block = block
+
+        height = layout.viewport_height
+        view = Image.new(mode='RGBA', size=(layout.width, height), color=WORLD_COLOR)
+        block_top = height - block.height
+        if block_top > 0:
+            view.paste(self.strip, (0, block_top - height))
+        view.paste(block, (0, block_top))
+
+        # The previous frame above this one, for scroll transitions
+        scroll = max(0, min(self.block_height - previous_height, height))
+        canvas = view
+        if scroll:
+            canvas = Image.new(mode='RGBA', size=(layout.width, height + scroll), color=WORLD_COLOR)
+            canvas.paste(self._view, (0, 0))
+            canvas.paste(view, (0, scroll))
+        self._view = view
+        return HistoryFrame(spec, canvas, scroll, layout)
+
+
+def ease_scroll(t):
+    """Smoothstep easing of a scroll transition, 0 ≤ t ≤ 1."""
+    return t * t * (3 - 2 * t)
+
+
+def draw_frame(spec, layout=DEFAULT_LAYOUT, sprites=None):
+    """Draws the frame of ``spec`` from scratch, without the frame cache."""
+    if isinstance(spec, JoinedFrameSpec):
+        return layout.compose(generate_joined_message_stack(spec.rows, spec.hour, layout))
+    renderer = BlockRenderer(spec.name_time, spec.profpic_file, spec.color, layout, sprites)
+    return layout.compose(renderer.render(spec.messages))
+
+
+@tracing.traced("render job")
+def render_frames(specs, chat_dir, layout=DEFAULT_LAYOUT, sprites=None, keys=None):
+    """
+    Renders ``specs`` in order and saves them as ``<index + 1>.png`` in ``chat_dir``.
+    ``sprites`` and ``keys`` are passed on to :func:`iter_rendered`.
+    """
+    if sprites is None:
+        sprites = emoji_store.SpriteSnapshot()
+    for frame in iter_rendered(specs, decode=False, layout=layout, sprites=sprites, keys=keys):
+        output_path = Path(chat_dir) / f"{frame.spec.index + 1:03d}.png"
+        image = frame.image
+        if frame.cached is not None:
+            if frame_cache.copy(frame.cached, output_path):
+                continue
+            # Pruned since the lookup: draw it after all
+            image = draw_frame(frame.spec, layout, sprites)
+        with tracing.span("save png", index=frame.spec.index):
+            image.save(str(output_path))
+        if frame.key is not None:
+            frame_cache.store(frame.key, png_file=output_path)
+
+
+def _images(specs, layout):
+    for frame in iter_rendered(specs, layout=layout):
+        if frame.key is not None and frame.cached is None:
+            frame_cache.store(frame.key, frame.image)
+        yield frame.image
+
+
+@tracing.traced("render job")
+def render_images(specs, layout=DEFAULT_LAYOUT):
+    """Renders ``specs`` in order and returns the images."""
+    return list(_images(specs, layout))
+
+
+def iter_history(lines, init_time, dt=30, timeline=None, seed=None, size=None):
+    """
+    Yields a :class:`HistoryFrame` per timeline frame of the full-history view
+    (see :class:`HistoryRenderer`). Takes the arguments of :func:`save_images`.
+    """
+    if timeline is None:
+        timeline = compile_script(lines)
+
+    rng = random if seed is None else random.Random(seed)
+    renderer = HistoryRenderer(layout_for(size))
+    for spec in plan_frames(timeline, init_time, dt, rng):
+        yield renderer.render(spec)
+
+
+def iter_images(lines, init_time, dt=30, timeline=None, workers=1, seed=None, size=None, history=False):
+    """
+    Yields the image of every timeline frame, in order, without saving anything.
+    Takes the same arguments as :func:`save_images`.
+    """
+    if timeline is None:
+        timeline = compile_script(lines)
+
+    if history:
+        for frame in iter_history(lines, init_time, dt, timeline, seed, size):
+            yield frame.view()
+        return
+
+    rng = random if seed is None else random.Random(seed)
+    specs = plan_frames(timeline, init_time, dt, rng)
+
+    layout = layout_for(size)
+
+    if workers <= 1 or len(specs) < 2:
+        yield from _images(specs, layout)
+        return
+
+    jobs = group_frame_specs(specs)
+    workers = min(workers, len(jobs))
+    jobs = iter(jobs)
+    with _process_pool(workers) as executor:
+        # Only a few jobs per worker run ahead of the consumer (e.g. the ffmpeg
+        # pipe), so finished frames never pile up in memory
+        pending = deque(executor.submit(render_images, job, layout)
+                        for job in islice(jobs, workers * JOBS_AHEAD_PER_WORKER))
+        while pending:
+            images = pending.popleft().result()
+            job = next(jobs, None)
+            if job is not None:
+                pending.append(executor.submit(render_images, job, layout))
+            yield from images
+
+
+@tracing.traced("save images", "stage")
+def save_images(lines, init_time, dt=30, timeline=None, workers=1, seed=None, chat_dir=None, size=None,
+                history=False):
+    """
+    Renders one PNG per timeline frame into ``chat_dir`` (default: ``chat/``) as
+    ``001.png``, ``002.png``, ….
+    Pass a precompiled ``timeline`` to share it with the video and audio stages.
+    With a ``size`` (width, height), frames are drawn at the video resolution
+    and padded to exactly that size; otherwise at the original 1777 px design.
+
+    With ``workers`` > 1 the blocks are rendered by a process pool. Random
+    choices are made up front, so a given ``seed`` gives identical images for
+    any worker count.
+
+    With ``history``, every frame shows the conversation so far instead of
+    only the current block (see :class:`HistoryRenderer`); these frames are
+    rendered in order by this process.
+    """
+    CHAT_DIR = Path(chat_dir) if chat_dir is not None else BASE_DIR / "chat"
+    CHAT_DIR.mkdir(parents=True, exist_ok=True)
+
+    if timeline is None:
+        timeline = compile_script(lines)
+
+    if history:
+        for frame in iter_history(lines, init_time, dt, timeline, seed, size):
+            image = frame.view()
+            with tracing.span("save png", index=frame.spec.index):
+                image.save(str(CHAT_DIR / f"{frame.spec.index + 1:03d}.png"))
+        return
+
+    rng = random if seed is None else random.Random(seed)
+    specs = plan_frames(timeline, init_time, dt, rng)
+    layout = layout_for(size)
+
+    if workers <= 1 or len(specs) < 2:
+        render_frames(specs, CHAT_DIR, layout)
+        return
+
+    jobs = group_frame_specs(specs)
+    if frame_cache.PERSIST_FRAMES:
+        # Blocks that are entirely cached are only copied, without a worker process
+        pending = []
+        for job in jobs:
+            sprites = emoji_store.SpriteSnapshot()
+            keys = [frame_key(spec, layout, sprites) for spec in job]
+            if all(frame_cache.contains(key) for key in keys):
+                render_frames(job, CHAT_DIR, layout, sprites, keys)
+            else:
+                pending.append(job)
+        jobs = pending
+        if not jobs:
+            return
+
+    with _process_pool(min(workers, len(jobs))) as executor:
+        # list() re-raises the first error of any job
+        list(executor.map(render_frames, jobs, [CHAT_DIR] * len(jobs), [layout] * len(jobs)))
 
 
 if __name__ == '__main__':
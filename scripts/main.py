@@ -2,16 +2,25 @@
 # --------------------------------------------------------------
 import sys
 import os
+import argparse
+import time
 import shutil
+import multiprocessing
 import datetime
+import random
+import threading
 from pathlib import Path
 from playsound import playsound
 import json
 #  Your existing functions (imported exactly as you had)
 # ----------------------------------------------------------------
+import frame_cache
+import tracing
 from generate_chat import get_filename as get_chat_filename, save_images
-from compile_images import gen_vid
+from compile_images import VIDEO_SIZE, gen_vid
+from ffmpeg_runner import FFmpegCancelled
 from script_validator import get_filename as get_validator_filename, validate_script_lines
+from script_compiler import compile_script
 from script_editor import VisualScriptEditor
 
 #  PyQt5 imports
@@ -35,22 +44,63 @@ if getattr(sys, 'frozen', False):
 else:
     BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Set from the command line (--trace DIR, --profile, --trace-memory): every
+# traced Worker job writes its trace, profile and memory dump to TRACE_DIR
+TRACE_DIR = None
+TRACE_PROFILE = False
+TRACE_MEMORY = False
+
 #  Worker thread for long tasks
 # ----------------------------------------------------------------
 class Worker(QObject):
     finished = pyqtSignal()
     error = pyqtSignal(str)
-
-    def __init__(self, func, *args, **kwargs):
+    # per mille done, label text
+    progress = pyqtSignal(int, str)
+
+    def __init__(self, func, *args, report_progress=False, trace=None, **kwargs):
+        """
+        With ``report_progress``, ``func`` also gets ``on_progress`` and
+        ``cancel`` keyword arguments (see ``gen_vid``): its ffmpeg progress is
+        re-emitted as :attr:`progress` and :meth:`cancel` stops it.
+        When tracing is on (see ``TRACE_DIR``), the job is traced as ``trace``.
+        """
         super().__init__()
         self.func = func
+        self.trace = trace
         self.args = args
         self.kwargs = kwargs
+        self.cancelled = threading.Event()
+        self.failed = threading.Event()
+        if report_progress:
+            self.kwargs.update(on_progress=self._report, cancel=self.cancelled)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _report(self, progress):
+        fraction = progress.fraction or 0.0
+        text = f"Compiling video … {fraction:.0%}"
+        if progress.eta is not None and not progress.done:
+            text += f"  (about {int(progress.eta) + 1}s left)"
+        self.progress.emit(int(fraction * 1000), text)
+
+    def _trace_files(self):
+        if TRACE_DIR is None or self.trace is None:
+            return None, None, None
+        base = Path(TRACE_DIR) / f"{time.strftime('%Y%m%d-%H%M%S')}-{self.trace}"
+        return (base.with_name(base.name + ".json"),
+                base.with_name(base.name + ".prof") if TRACE_PROFILE else None,
+                base.with_name(base.name + ".memory.txt") if TRACE_MEMORY else None)
 
     def run(self):
         try:
-            self.func(*self.args, **self.kwargs)
+            with tracing.session(*self._trace_files()):
+                self.func(*self.args, **self.kwargs)
+        except FFmpegCancelled:
+            pass
         except Exception as e:
+            self.failed.set()
             self.error.emit(str(e))
         finally:
             self.finished.emit()
@@ -220,6 +270,11 @@ def run_validate_script():
         
 #  GENERATE CHAT – GUI version
 # ----------------------------------------------------------------
+# Clock and seed of each script rendered in this session: re-rendering an edited
+# script keeps its timestamps and joined messages, so unchanged frames come
+# straight from the frame cache.
+_script_settings = {}
+
 def run_generate_chat():
     CHAT_DIR = BASE_DIR / "chat"
     FINAL_VIDEO = BASE_DIR / "final_video.mp4"
@@ -238,7 +293,12 @@ def run_generate_chat():
     # Step 2: VALIDATE FIRST
     if not validate_and_show(lines):
         return  # Stop if invalid
-    now = datetime.datetime.now()
+    now, seed = _script_settings.setdefault(
+        os.path.abspath(filename), (datetime.datetime.now(), random.randrange(2 ** 32))
+    )
+
+    # Parse once – images, video durations and sound offsets share this timeline
+    timeline = compile_script(lines)
 
     # ---- STEP 1 – images ------------------------------------------------
     prog = QProgressDialog("Generating chat images …", "Cancel", 0, 0,parent)
@@ -251,7 +311,8 @@ def run_generate_chat():
     prog.show()
     
     thread = QThread()
-    worker = Worker(save_images, lines, now)
+    worker = Worker(save_images, lines, now, timeline=timeline, workers=os.cpu_count() or 1, seed=seed,
+                    size=VIDEO_SIZE, trace="images")
     worker.moveToThread(thread)
     worker.finished.connect(thread.quit)
     worker.finished.connect(prog.close)
@@ -261,6 +322,9 @@ def run_generate_chat():
 
     while thread.isRunning():
         QApplication.processEvents()
+    frame_cache.prune()
+    if worker.failed.is_set():
+        return
 
     # try:
     #     save_images(lines, init_time=now)
@@ -272,18 +336,21 @@ def run_generate_chat():
     #     prog.close()
 
     # ---- STEP 2 – video -------------------------------------------------
-    prog = QProgressDialog("Compiling video …", "Cancel", 0, 0, parent)
+    prog = QProgressDialog("Compiling video …", "Cancel", 0, 1000, parent)
     prog.setWindowTitle("Step 2 / 2")
     prog.setModal(True)
     prog.setWindowModality(Qt.WindowModal)
-    prog.setCancelButton(None)
+    prog.setAutoClose(False)
+    prog.setAutoReset(False)
     prog.setFixedWidth(300)
     prog.setMinimumDuration(0)
     prog.show()
     
     thread = QThread()
-    worker = Worker(gen_vid, filename)
+    worker = Worker(gen_vid, filename, timeline=timeline, segmented=True, report_progress=True, trace="video")
     worker.moveToThread(thread)
+    worker.progress.connect(lambda value, text: (prog.setValue(value), prog.setLabelText(text)))
+    prog.canceled.connect(worker.cancel)
     worker.finished.connect(thread.quit)
     worker.finished.connect(prog.close)
     worker.error.connect(lambda e: show_message("Video Error", e, color="#ff5555"))
@@ -292,6 +359,8 @@ def run_generate_chat():
 
     while thread.isRunning():
         QApplication.processEvents()
+    if worker.cancelled.is_set() or worker.failed.is_set():
+        return
         
     # try:
     #     gen_vid(filename)
@@ -817,6 +886,19 @@ class BelugaMenu(QWidget):
 # ----------------------------------------------------------------
 #  Entry point
 # ----------------------------------------------------------------
+def parse_trace_args(argv):
+    """Reads the tracing options from the command line (Qt ignores the ones it does not know)."""
+    global TRACE_DIR, TRACE_PROFILE, TRACE_MEMORY
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--trace", metavar="DIR")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--trace-memory", action="store_true")
+    args, _ = parser.parse_known_args(argv)
+    TRACE_DIR = args.trace
+    TRACE_PROFILE = args.profile
+    TRACE_MEMORY = args.trace_memory
+
+
 def show_gui_menu():
     app = QApplication(sys.argv)
     win = BelugaMenu()
@@ -825,4 +907,7 @@ def show_gui_menu():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # frame rendering workers in the .exe build
+    frame_cache.configure(persist=True)
+    parse_trace_args(sys.argv[1:])
     show_gui_menu()
\ No newline at end of file
@@ -0,0 +1,45 @@
+from typing import NamedTuple, Optional, Tuple
+
+
+class OutputPreset(NamedTuple):
+    """Resolution, frame rate and x264 settings of the rendered video."""
+    name: str
+    size: Tuple[int, int]
+    fps: int = 25
+    crf: int = 25
+    x264_preset: Optional[str] = None  # ultrafast … veryslow (None: x264's default, medium)
+    tune: Optional[str] = None         # e.g. "stillimage" for chats, which barely move
+    vfr: bool = False                  # one encoded frame per chat image instead of a constant fps
+
+    def x264_args(self):
+        """Encoder arguments for ffmpeg."""
+        args = ["-vcodec", "libx264"]
+        if self.x264_preset:
+            args += ["-preset", self.x264_preset]
+        args += ["-crf", str(self.crf)]
+        if self.tune:
+            args += ["-tune", self.tune]
+        return args + ["-pix_fmt", "yuv420p"]
+
+
+PRESETS = {
+    # Quick previews: small frames, few of them, fastest encoder settings
+    "draft": OutputPreset("draft", (640, 360), fps=10, crf=30, x264_preset="ultrafast", tune="stillimage"),
+    "standard": OutputPreset("standard", (1280, 720)),
+    "high": OutputPreset("high", (1920, 1080), fps=30, crf=18, x264_preset="slow", tune="stillimage"),
+    # Shorts / TikTok / Reels
+    "vertical": OutputPreset("vertical", (1080, 1920), fps=30, crf=21, tune="stillimage"),
+}
+DEFAULT_PRESET = "standard"
+
+
+def get_preset(preset=None):
+    """Returns the preset called ``preset`` (or ``preset`` itself if it already is one)."""
+    if preset is None:
+        preset = DEFAULT_PRESET
+    if isinstance(preset, OutputPreset):
+        return preset
+    try:
+        return PRESETS[preset]
+    except KeyError:
+        raise ValueError(f"Unknown output preset '{preset}', expected one of: {', '.join(PRESETS)}") from None
@@ -0,0 +1,309 @@
+"""
+Long-running render daemon: takes scripts from a spool directory and/or a Unix
+socket and renders them with :func:`beluga.render`, keeping the font, avatar,
+emoji and sound caches of the process warm from one job to the next.
+
+    python scripts/render_service.py serve --spool spool/ --socket /tmp/beluga.sock -J 4
+    python scripts/render_service.py submit --socket /tmp/beluga.sock script.txt -o out.mp4
+    python scripts/render_service.py status --socket /tmp/beluga.sock [JOB]
+
+Spool layout (created on start):
+
+    spool/inbox/           drop ``name.txt`` scripts or ``name.json`` job specs here
+    spool/jobs/<job>/      claimed script, status.json, the video and (on failure) the work files
+
+Write files to the inbox under a name starting with ``.`` and rename them when
+complete; hidden files are never picked up. A job spec is a JSON object with a
+``script`` path (relative to the inbox) and any :class:`beluga.RenderOptions`
+field (``output``, ``start_time`` as HH:MM, ``seed``, ``workers``, ``stream``,
+``audio_engine``).
+"""
+import sys
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import avatar_cache
+import frame_cache
+import sample_cache
+from beluga import RenderOptions, ScriptValidationError, render
+from generate_chat import layout_for
+from presets import get_preset
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = Path(sys.executable).resolve().parent
+else:
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_SPOOL_DIR = BASE_DIR / "spool"
+POLL_INTERVAL = 1.0  # seconds between two scans of the inbox
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+log = logging.getLogger(__name__)
+
+
+def _parse_start_time(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    clock = datetime.datetime.strptime(value, "%H:%M")
+    return datetime.datetime.combine(datetime.date.today(), clock.time())
+
+
+def job_options(spec, job_dir, defaults):
+    """Builds the :class:`RenderOptions` of a job spec, on top of the service ``defaults``."""
+    unknown = set(spec) - set(RenderOptions._fields) - {"script", "command"}
+    if unknown:
+        raise ValueError(f"Unknown job option(s): {', '.join(sorted(unknown))}")
+    options = defaults._replace(**{key: value for key, value in spec.items() if key in RenderOptions._fields})
+    return options._replace(
+        output=Path(options.output) if "output" in spec else job_dir / f"{job_dir.name}.mp4",
+        start_time=_parse_start_time(options.start_time),
+        work_dir=Path(options.work_dir) if options.work_dir is not None else job_dir / "work",
+    )
+
+
+class RenderService:
+    """
+    Runs render jobs on up to ``max_jobs`` threads. Each job renders in-process
+    (``workers`` frame processes, 1 by default) so it reuses the caches warmed by
+    the jobs before it; ffmpeg runs of concurrent jobs overlap freely.
+    """
+
+    def __init__(self, spool_dir=DEFAULT_SPOOL_DIR, max_jobs=2, defaults=None):
+        self.spool_dir = Path(spool_dir).resolve()
+        self.inbox = self.spool_dir / "inbox"
+        self.jobs_dir = self.spool_dir / "jobs"
+        self.defaults = defaults or RenderOptions(workers=1)
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="render-job")
+        self._lock = threading.Lock()
+        self._status = {}
+        self._stop = threading.Event()
+        self.inbox.mkdir(parents=True, exist_ok=True)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- jobs ----------------------------------------------------------
+    def submit(self, script, spec=None):
+        """Queues ``script`` (a path) with the options of ``spec``. Returns the job id."""
+        script = Path(script)
+        if not script.is_file():
+            raise FileNotFoundError(f"Script not found: {script}")
+        job_id = f"{script.stem}-{uuid.uuid4().hex[:8]}"
+        job_dir = self.jobs_dir / job_id
+        job_dir.mkdir(parents=True)
+        job_script = job_dir / script.name
+        shutil.copyfile(script, job_script)
+
+        self._set_status(job_id, state=QUEUED, script=str(script), submitted=time.time())
+        self._executor.submit(self._run, job_id, job_script, dict(spec or {}))
+        log.info("Queued job %s (%s)", job_id, script)
+        return job_id
+
+    def _run(self, job_id, job_script, spec):
+        job_dir = job_script.parent
+        started = time.time()
+        self._set_status(job_id, state=RUNNING, started=started)
+        try:
+            options = job_options(spec, job_dir, self.defaults)
+            output = render(job_script, options)
+        except ScriptValidationError as e:
+            self._set_status(job_id, state=FAILED, finished=time.time(), error=str(e), errors=e.errors)
+            log.warning("Job %s rejected: %s", job_id, e)
+            return
+        except Exception as e:
+            self._set_status(job_id, state=FAILED, finished=time.time(), error=str(e),
+                             traceback=traceback.format_exc())
+            log.exception("Job %s failed", job_id)
+            return
+
+        if options.work_dir == job_dir / "work":
+            shutil.rmtree(options.work_dir, ignore_errors=True)
+        finished = time.time()
+        self._set_status(job_id, state=DONE, finished=finished, output=str(output), seconds=round(finished - started, 3))
+        log.info("Job %s done in %.1fs → %s", job_id, finished - started, output)
+
+    # --- status --------------------------------------------------------
+    def _set_status(self, job_id, **fields):
+        with self._lock:
+            status = self._status.setdefault(job_id, {"job": job_id})
+            status.update(fields)
+            snapshot = dict(status)
+        status_path = self.jobs_dir / job_id / "status.json"
+        tmp_path = status_path.with_name(".status.json.tmp")
+        tmp_path.write_text(json.dumps(snapshot, indent=2), encoding="utf8")
+        os.replace(tmp_path, status_path)
+
+    def status(self, job_id=None):
+        """Status of ``job_id``, or of every job seen by this service."""
+        with self._lock:
+            if job_id is None:
+                return [dict(status) for status in self._status.values()]
+            if job_id not in self._status:
+                raise KeyError(f"Unknown job '{job_id}'")
+            return dict(self._status[job_id])
+
+    # --- spool directory -----------------------------------------------
+    def scan_inbox(self):
+        """Claims every complete script and job spec in the inbox."""
+        for entry in sorted(self.inbox.iterdir()):
+            if entry.name.startswith(".") or entry.suffix not in (".txt", ".json"):
+                continue
+            if entry.suffix == ".txt" and entry.with_suffix(".json").exists():
+                continue  # picked up with its spec
+            try:
+                if entry.suffix == ".json":
+                    spec = json.loads(entry.read_text(encoding="utf8"))
+                    script = self.inbox / spec.get("script", entry.with_suffix(".txt").name)
+                    self.submit(script, spec)
+                    if script.parent == self.inbox:
+                        script.unlink()
+                else:
+                    self.submit(entry)
+            except Exception:
+                log.exception("Could not queue %s", entry.name)
+                rejected = self.spool_dir / "rejected"
+                rejected.mkdir(exist_ok=True)
+                shutil.move(str(entry), str(rejected / entry.name))
+                continue
+            entry.unlink()
+
+    def serve_forever(self, poll_interval=POLL_INTERVAL):
+        while not self._stop.is_set():
+            self.scan_inbox()
+            self._stop.wait(poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.stop()
+        self._executor.shutdown(wait=True)
+
+
+# ----------------------------------------------------------------------
+# Unix socket: one JSON request per line, one JSON reply per line
+# ----------------------------------------------------------------------
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                command = request.get("command", "submit")
+                if command == "submit":
+                    reply = service.status(service.submit(request["script"], request))
+                elif command == "status":
+                    reply = service.status(request.get("job"))
+                else:
+                    raise ValueError(f"Unknown command '{command}'")
+            except Exception as e:
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf8") + b"\n")
+
+
+class _SocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_socket(service, socket_path):
+    """Starts answering requests on ``socket_path`` in a background thread. Returns the server."""
+    socket_path = Path(socket_path)
+    if socket_path.exists():
+        socket_path.unlink()
+    server = _SocketServer(str(socket_path), _RequestHandler)
+    server.service = service
+    threading.Thread(target=server.serve_forever, name="render-socket", daemon=True).start()
+    log.info("Listening on %s", socket_path)
+    return server
+
+
+def request(socket_path, message):
+    """Sends one request to a running service and returns its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        client.sendall(json.dumps(message).encode("utf8") + b"\n")
+        with client.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+
+# ----------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="render_service", description="Render daemon for Beluga chat scripts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="Run the render service.")
+    serve_cmd.add_argument("--spool", default=str(DEFAULT_SPOOL_DIR), help="Spool directory (default: spool/).")
+    serve_cmd.add_argument("--socket", help="Also accept jobs on this Unix socket.")
+    serve_cmd.add_argument("-J", "--max-jobs", type=int, default=2, help="Jobs rendered at the same time (default: 2).")
+    serve_cmd.add_argument("-j", "--workers", type=int, default=1, help="Frame rendering processes per job (default: 1).")
+    serve_cmd.add_argument("--persist-caches", action="store_true",
+                           help="Keep avatars, decoded sounds and rendered frames in cache/ between jobs and restarts.")
+
+    submit_cmd = commands.add_parser("submit", help="Send a script to a running service.")
+    submit_cmd.add_argument("--socket", required=True)
+    submit_cmd.add_argument("script_file")
+    submit_cmd.add_argument("-o", "--output")
+    submit_cmd.add_argument("--seed", type=int)
+    submit_cmd.add_argument("--start-time", help="Clock of the first message, as HH:MM.")
+
+    status_cmd = commands.add_parser("status", help="Show the status of one or all jobs.")
+    status_cmd.add_argument("--socket", required=True)
+    status_cmd.add_argument("job", nargs="?")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        message = {"command": "submit", "script": str(Path(args.script_file).resolve())}
+        if args.output:
+            message["output"] = str(Path(args.output).resolve())
+        if args.seed is not None:
+            message["seed"] = args.seed
+        if args.start_time:
+            message["start_time"] = args.start_time
+        reply = request(args.socket, message)
+        print(json.dumps(reply, indent=2))
+        return 1 if "error" in reply else 0
+
+    if args.command == "status":
+        reply = request(args.socket, {"command": "status", "job": args.job})
+        print(json.dumps(reply, indent=2))
+        return 1 if isinstance(reply, dict) and "error" in reply else 0
+
+    if args.persist_caches:
+        avatar_cache.configure(persist=True)
+        frame_cache.configure(persist=True)
+        sample_cache.configure(persist=True)
+    defaults = RenderOptions(workers=args.workers)
+    # Load the fonts of the default preset before the first job (jobs rendered in this process reuse them)
+    layout_for(get_preset(defaults.preset).size).fonts()
+
+    service = RenderService(args.spool, max_jobs=args.max_jobs, defaults=defaults)
+    server = serve_socket(service, args.socket) if args.socket else None
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+    log.info("Render service started: spool %s, %d job(s) at a time", service.spool_dir, args.max_jobs)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+            Path(args.socket).unlink(missing_ok=True)
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import sys
+import hashlib
+import logging
+import os
+import threading
+import wave
+from pathlib import Path
+
+import numpy as np
+
+import ffmpeg_runner
+import tracing
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = Path(sys.executable).resolve().parent
+else:
+    BASE_DIR = Path(__file__).resolve().parent.parent
+
+SAMPLE_CACHE_DIR = BASE_DIR / "cache" / "samples"
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+# Set to True (or call configure()) to keep decoded samples as WAV files between runs
+PERSIST_SAMPLES = False
+
+log = logging.getLogger(__name__)
+
+# (sound file, mtime) -> float32 array of shape (frames, CHANNELS)
+_samples = {}
+
+
+def configure(persist=True, cache_dir=None):
+    """Enables/disables the on-disk sample cache and optionally moves it."""
+    global PERSIST_SAMPLES, SAMPLE_CACHE_DIR
+    PERSIST_SAMPLES = persist
+    if cache_dir is not None:
+        SAMPLE_CACHE_DIR = Path(cache_dir)
+
+
+def clear():
+    """Drops every sample held in memory (the disk cache is left alone)."""
+    _samples.clear()
+
+
+def load_sample(sound_file) -> np.ndarray:
+    """
+    Returns ``sound_file`` decoded to 16-bit stereo PCM at ``SAMPLE_RATE`` Hz, as a
+    float32 array. Each file is decoded once per process (and once overall when
+    persisting); the returned array is shared and must not be modified.
+    """
+    sound_file = Path(sound_file)
+    key = (str(sound_file), sound_file.stat().st_mtime_ns)
+    sample = _samples.get(key)
+    tracing.count_lookup("samples", sample is not None)
+    if sample is not None:
+        return sample
+
+    wav_path = _wav_path(sound_file, key[1]) if PERSIST_SAMPLES else None
+    if wav_path is not None and wav_path.exists():
+        sample = _read_wav(wav_path)
+    else:
+        sample = _decode(sound_file)
+        if wav_path is not None:
+            write_wav(wav_path, sample)
+
+    _samples[key] = sample
+    return sample
+
+
+def sample_file(sound_file) -> Path:
+    """
+    Returns a file holding the decoded PCM of ``sound_file``: the persisted WAV
+    when the disk cache is on, else the original file.
+    """
+    sound_file = Path(sound_file)
+    if not PERSIST_SAMPLES:
+        return sound_file
+    wav_path = _wav_path(sound_file, sound_file.stat().st_mtime_ns)
+    if not wav_path.exists():
+        load_sample(sound_file)
+    return wav_path
+
+
+def _wav_path(sound_file: Path, mtime: int) -> Path:
+    digest = hashlib.sha1(f"{sound_file}|{mtime}".encode("utf8")).hexdigest()[:12]
+    return SAMPLE_CACHE_DIR / f"{sound_file.stem}-{SAMPLE_RATE}-{digest}.wav"
+
+
+def _decode(sound_file: Path) -> np.ndarray:
+    log.debug("Decoding sample: %s", sound_file)
+    ffmpeg_args = ["-i", str(sound_file), "-f", "s16le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "-"]
+    pcm = ffmpeg_runner.run(ffmpeg_args, f"decode {sound_file}", stdout=True)
+    # 16-bit like the persisted WAV, so cached and fresh samples are identical
+    return _from_pcm(pcm)
+
+
+def _read_wav(wav_path: Path) -> np.ndarray:
+    with wave.open(str(wav_path), "rb") as wav:
+        return _from_pcm(wav.readframes(wav.getnframes()))
+
+
+def _from_pcm(data: bytes) -> np.ndarray:
+    return (np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0).reshape(-1, CHANNELS)
+
+
+def write_wav(wav_path: Path, sample: np.ndarray) -> None:
+    """
+    Writes a float32 (frames, CHANNELS) array as a 16-bit PCM WAV file. The file
+    appears complete or not at all, as other jobs may read it at the same time.
+    """
+    wav_path = Path(wav_path)
+    wav_path.parent.mkdir(parents=True, exist_ok=True)
+    pcm = np.round(sample * 32768.0).clip(-32768, 32767).astype(np.int16)
+    tmp_path = wav_path.with_name(f".{wav_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with wave.open(str(tmp_path), "wb") as wav:
+            wav.setnchannels(CHANNELS)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(pcm.tobytes())
+        os.replace(tmp_path, wav_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
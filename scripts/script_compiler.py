@@ -0,0 +1,174 @@
+from decimal import Decimal, InvalidOperation
+from typing import List, NamedTuple, Optional, Tuple
+
+import tracing
+
+# ----------------------------------------------------------------------
+# Frame kinds
+# ----------------------------------------------------------------------
+MESSAGE = "message"
+JOINED = "joined"
+
+DURATION_MARKER = "$^"
+SOUND_MARKER = "#!"
+
+
+class ScriptError(ValueError):
+    """Raised when a script line cannot be compiled."""
+
+    def __init__(self, line_no: int, message: str):
+        super().__init__(f"Line {line_no}: {message}")
+        self.line_no = line_no
+
+
+class Frame(NamedTuple):
+    """
+    One entry of the timeline, i.e. one rendered image held for ``duration`` seconds.
+
+    ``runs`` holds the message texts of the speaker's block up to and including
+    this frame, or the names of the stacked "joined" rows for a JOINED frame.
+    ``block_start`` is the frame index at which the block's clock was taken
+    (the first row of a joined stack is also its first frame).
+    """
+    index: int
+    kind: str
+    speaker: str
+    runs: Tuple[str, ...]
+    block_start: int
+    start: float
+    duration: float
+    sound: Optional[str]
+    line_no: int
+
+
+class Timeline(NamedTuple):
+    """Immutable result of :func:`compile_script`, consumed by every stage."""
+    frames: Tuple[Frame, ...]
+
+    @property
+    def duration(self) -> float:
+        if not self.frames:
+            return 0.0
+        last = self.frames[-1]
+        return last.start + last.duration
+
+    @property
+    def cues(self) -> Tuple[Frame, ...]:
+        """Frames that trigger a sound effect."""
+        return tuple(frame for frame in self.frames if frame.sound)
+
+
+def split_markers(line: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Split ``text$^duration#!sound`` into ``(text, duration, sound)``.
+    ``duration`` is None when the '$^' marker is missing, ``sound`` when '#!' is.
+    """
+    if DURATION_MARKER not in line:
+        return line, None, None
+    text, rest = line.split(DURATION_MARKER, 1)
+    rest = rest.strip()
+    if SOUND_MARKER in rest:
+        duration, sound = rest.split(SOUND_MARKER, 1)
+        return text, duration.strip(), sound.strip()
+    return text, rest, None
+
+
+@tracing.traced("parse", "script")
+def compile_script(lines, errors: Optional[List[ScriptError]] = None) -> Timeline:
+    """
+    Compile script lines into a :class:`Timeline`.
+
+    By default the first malformed line raises :class:`ScriptError`. When an
+    ``errors`` list is given, every problem is appended to it instead and the
+    offending line is skipped, so a validator can report them all at once.
+    """
+    def fail(line_no, message):
+        error = ScriptError(line_no, message)
+        if errors is None:
+            raise error
+        errors.append(error)
+
+    frames = []
+    # Exact decimal sum of the written durations, so late cues do not drift
+    elapsed = Decimal(0)
+    name_up_next = True
+    speaker = None
+    block_start = 0
+    block_runs = ()
+    joined_start = 0
+    joined_names = ()
+
+    for line_no, raw_line in enumerate(lines, start=1):
+        line = raw_line.strip()
+        if line == "":
+            name_up_next = True
+            block_runs = ()
+            joined_names = ()
+            continue
+        if line.startswith("#"):
+            joined_names = ()
+            continue
+
+        if line.startswith("WELCOME "):
+            text, duration, sound = split_markers(line)
+            words = text.split(" ")
+            name = words[1] if len(words) > 1 else ""
+            duration = _parse_duration(line_no, line, duration, fail)
+            if duration is None:
+                continue
+            if not name:
+                fail(line_no, f"Missing character name in WELCOME line: {line}")
+                continue
+            if not joined_names:
+                joined_start = len(frames)
+            joined_names += (name,)
+            frames.append(Frame(len(frames), JOINED, name, joined_names,
+                                joined_start, float(elapsed), float(duration), sound, line_no))
+            elapsed += duration
+            continue
+        joined_names = ()
+
+        if name_up_next:
+            if ":" not in line:
+                fail(line_no, f"Expected a name line containing ':' but got: {line}")
+            elif not line.split(":", 1)[0].strip():
+                fail(line_no, "Name part before ':' is empty.")
+            speaker = line.split(":", 1)[0].strip()
+            block_start = len(frames)
+            name_up_next = False
+            continue
+
+        text, duration, sound = split_markers(line)
+        duration = _parse_duration(line_no, line, duration, fail)
+        if duration is None:
+            continue
+        block_runs += (text,)
+        frames.append(Frame(len(frames), MESSAGE, speaker, block_runs,
+                            block_start, float(elapsed), float(duration), sound, line_no))
+        elapsed += duration
+
+    return Timeline(tuple(frames))
+
+
+def compile_file(filename) -> Timeline:
+    """Read a script file and compile it."""
+    with open(filename, encoding="utf8") as f:
+        return compile_script(f.read().splitlines())
+
+
+def _parse_duration(line_no, line, duration, fail) -> Optional[Decimal]:
+    if duration is None:
+        fail(line_no, f"Expected '$^' delimiter in message line but got: {line}")
+        return None
+    if duration == "":
+        fail(line_no, "Missing duration information after '$^'.")
+        return None
+    try:
+        value = Decimal(duration)
+    except InvalidOperation:
+        fail(line_no, f"Unable to convert duration '{duration}' to a number.")
+        return None
+    if not value.is_finite() or value < 0:
+        fail(line_no, f"Duration '{duration}' must be a non-negative number of seconds.")
+        return None
+    return value
@@ -2,9 +2,10 @@ import sys
 import os
 import re
 import argparse
-from PyQt5.QtWidgets import QApplication, QFileDialog
 from pathlib import Path
 
+from script_compiler import ScriptError, compile_script
+
 if getattr(sys, 'frozen', False):
     BASE_DIR = Path(sys.executable).resolve().parent
 else:
@@ -14,6 +15,8 @@ SOUNDS_DIR = BASE_DIR / "assets" / "sounds" / "mp3"
 
 def get_filename():
     """Opens a file dialog and returns the selected filename."""
+    from PyQt5.QtWidgets import QApplication, QFileDialog
+
     app = QApplication(sys.argv)
     options = QFileDialog.Options()
     filename, _ = QFileDialog.getOpenFileName(
@@ -29,60 +32,26 @@ def validate_script_lines(lines):
     Expected structure:
       - An empty line: resets the block state.
       - Lines starting with '#' are comments and are skipped.
-      - Lines starting with "WELCOME " are treated as joined messages.
+      - Lines starting with "WELCOME " are treated as joined messages and need a duration too.
       - The first non-empty, non-comment, non-WELCOME line in a block should be a name line (must contain a colon).
       - Subsequent lines in that block (chat messages) must contain the delimiter '$^' with a valid float duration,
         optionally followed by a sound marker starting with "#!".
       - If a sound marker is present, the referenced sound file (../assets/sounds/mp3/<sound>.mp3) must exist.
     """
     errors = []
-    state = "waiting_for_name"  # or "collecting_messages"
-    for idx, raw_line in enumerate(lines, start=1):
-        line = raw_line.strip()
-        if line == "":
-            state = "waiting_for_name"
-            continue
-        if line.startswith("#"):
-            continue
-        if line.startswith("WELCOME "):
-            continue
+    timeline = compile_script(lines, errors=errors)
+
+    # The compiler only checks syntax; sound effects must also exist on disk.
+    for frame in timeline.cues:
+        sound_path = os.path.join(SOUNDS_DIR, f"{frame.sound}.mp3")
+        if not os.path.isfile(sound_path):
+            errors.append(ScriptError(
+                frame.line_no,
+                f"Sound effect '{frame.sound}' does not exist at expected location: {sound_path}"
+            ))
 
-        if state == "waiting_for_name":
-            # Expect a name line like "Name: rest-of-line"
-            if ":" not in line:
-                errors.append(f"Line {idx}: Expected a name line containing ':' but got: {line}")
-            else:
-                name_part = line.split(":", 1)[0].strip()
-                if not name_part:
-                    errors.append(f"Line {idx}: Name part before ':' is empty.")
-            state = "collecting_messages"
-        else:
-            # In message lines we expect the '$^' delimiter.
-            if "$^" not in line:
-                errors.append(f"Line {idx}: Expected '$^' delimiter in message line but got: {line}")
-            else:
-                parts = line.split("$^", 1)
-                # The second part should start with a valid duration.
-                duration_part = parts[1].strip()
-                if duration_part == "":
-                    errors.append(f"Line {idx}: Missing duration information after '$^'.")
-                else:
-                    # Check if a sound marker is included.
-                    if "#!" in duration_part:
-                        dur_str, sound_marker = duration_part.split("#!", 1)
-                        dur_str = dur_str.strip()
-                        sound_name = sound_marker.strip()
-                        # Check that the sound effect file exists.
-                        sound_path = os.path.join(SOUNDS_DIR, f"{sound_name}.mp3")
-                        if not os.path.isfile(sound_path):
-                            errors.append(f"Line {idx}: Sound effect '{sound_name}' does not exist at expected location: {sound_path}")
-                    else:
-                        dur_str = duration_part
-                    try:
-                        float(dur_str)
-                    except ValueError:
-                        errors.append(f"Line {idx}: Unable to convert duration '{dur_str}' to a number.")
-    return errors
+    errors.sort(key=lambda error: error.line_no)
+    return [str(error) for error in errors]
 
 def main():
     parser = argparse.ArgumentParser(description="Validate a script text file for chat generation.")
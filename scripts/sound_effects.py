@@ -1,8 +1,15 @@
 import sys
 import os
+import shutil
 import logging
+import threading
 from pathlib import Path
-from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
+from typing import Optional
+
+import ffmpeg_runner
+import tracing
+from audio_engine import DEFAULT_ENGINE, Cue, mix_soundtrack
+from script_compiler import JOINED, Timeline, compile_file
 
 # ----------------------------------------------------------------------
 # Logging configuration
@@ -25,113 +32,74 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 # ----------------------------------------------------------------------
-def add_sounds(filename: str) -> None:
+@tracing.traced("add sounds", "stage")
+def add_sounds(filename: str, timeline: Optional[Timeline] = None, engine: str = DEFAULT_ENGINE,
+               work_dir: Optional[Path] = None, output_path: Optional[Path] = None,
+               cancel: Optional[threading.Event] = None) -> Path:
     """
-    Reads a timing file, overlays the specified sound clips onto
-    ``output.mp4`` and writes the result to ``../final_video.mp4``.
+    Reads a timing file (or a precompiled ``timeline``), overlays the specified
+    sound clips onto ``output.mp4`` in ``work_dir`` (default: the repository root)
+    and writes the result to ``output_path`` (default: ``final_video.mp4``).
+    The video stream is copied as is; only the soundtrack gets encoded.
+    ``engine`` picks the mixer from ``audio_engine.ENGINES``; setting ``cancel``
+    stops the final mux.
     """
+    work_dir = Path(work_dir) if work_dir is not None else BASE_DIR
+    output_path = Path(output_path) if output_path is not None else BASE_DIR / "final_video.mp4"
     log.info("Starting add_sounds() for file: %s", filename)
 
     # ------------------------------------------------------------------
-    # Load the base video
+    # Check the base video
     # ------------------------------------------------------------------
-    video_path = BASE_DIR / "output.mp4"
+    video_path = work_dir / "output.mp4"
     if not video_path.exists():
         log.error("Base video not found: %s", video_path)
         raise FileNotFoundError(f"Video file missing: {video_path}")
 
-    log.info("Loading video: %s", video_path)
-    video = VideoFileClip(str(video_path))
-    duration = 0.0
-    audio_clips = []
+    cues = []
 
     # ------------------------------------------------------------------
-    # Parse the timing file
+    # Place sound cues on the compiled timeline
     # ------------------------------------------------------------------
-    timing_path = Path(filename)
-    if not timing_path.exists():
-        log.error("Timing file not found: %s", timing_path)
-        raise FileNotFoundError(f"Timing file missing: {timing_path}")
-
-    log.info("Reading timing file: %s", timing_path)
-    with open(timing_path, encoding="utf8") as f:
-        name_up_next = True
-        for line_no, raw_line in enumerate(f.read().splitlines(), start=1):
-            line = raw_line.strip()
-            if not line:
-                log.debug("Line %d: empty – resetting name flag", line_no)
-                name_up_next = True
-                continue
-            if line.startswith('#'):
-                log.debug("Line %d: comment – skipping", line_no)
-                continue
-
-            # ----- WELCOME lines ------------------------------------------------
-            if line.startswith("WELCOME"):
-                parts = line.split('$^')
-                if len(parts) < 2:
-                    log.warning("Line %d: malformed WELCOME line – skipping", line_no)
-                    continue
-
-                if "#!" in line:
-                    duration_part, sound_part = parts[1].split("#!")
-                    sound_file = BASE_DIR / 'assets' / 'sounds' / 'mp3' / f'{sound_part.strip()}.mp3'
-                    _add_audio_clip(sound_file, float(duration_part), audio_clips, duration)
-                    duration += float(duration_part)
-                    log.info(
-                        "Line %d: WELCOME sound '%s' (%.2fs) at %.2fs",
-                        line_no, sound_part.strip(), float(duration_part), duration
-                    )
-                else:
-                    duration += float(parts[1])
-                    log.info("Line %d: WELCOME pause %.2fs → new duration %.2fs", line_no, float(parts[1]), duration)
-                continue
-
-            # ----- Name lines ---------------------------------------------------
-            if name_up_next:
-                log.debug("Line %d: name line – will be used next", line_no)
-                name_up_next = False
-                continue
-
-            # ----- Regular timed lines -----------------------------------------
-            parts = line.split('$^')
-            if len(parts) < 2:
-                log.warning("Line %d: malformed timed line – skipping", line_no)
-                continue
-
-            if "#!" in line:
-                duration_part, sound_part = parts[1].split("#!")
-                sound_file = BASE_DIR / 'assets' / 'sounds' / 'mp3' / f'{sound_part.strip()}.mp3'
-                _add_audio_clip(sound_file, float(duration_part), audio_clips, duration)
-                duration += float(duration_part)
-                log.info(
-                    "Line %d: sound '%s' (%.2fs) at %.2fs",
-                    line_no, sound_part.strip(), float(duration_part), duration
-                )
-            else:
-                duration += float(parts[1])
-                log.info("Line %d: pause %.2fs → new duration %.2fs", line_no, float(parts[1]), duration)
+    if timeline is None:
+        timing_path = Path(filename)
+        if not timing_path.exists():
+            log.error("Timing file not found: %s", timing_path)
+            raise FileNotFoundError(f"Timing file missing: {timing_path}")
+
+        log.info("Reading timing file: %s", timing_path)
+        timeline = compile_file(timing_path)
+
+    for frame in timeline.frames:
+        kind = "WELCOME " if frame.kind == JOINED else ""
+        if frame.sound:
+            sound_file = BASE_DIR / 'assets' / 'sounds' / 'mp3' / f'{frame.sound}.mp3'
+            _add_audio_clip(sound_file, frame.duration, cues, frame.start)
+            log.info(
+                "Line %d: %ssound '%s' (%.2fs) at %.2fs",
+                frame.line_no, kind, frame.sound, frame.duration, frame.start
+            )
+        else:
+            log.info("Line %d: %spause %.2fs at %.2fs", frame.line_no, kind, frame.duration, frame.start)
 
     # ------------------------------------------------------------------
-    # Compose audio and write final video
+    # Mix the soundtrack and mux it next to the already encoded video
     # ------------------------------------------------------------------
-    if audio_clips:
-        log.info("Compositing %d audio clip(s)", len(audio_clips))
-        composite_audio = CompositeAudioClip(audio_clips)
-        video = video.set_audio(composite_audio)
+    if cues:
+        soundtrack_path = work_dir / "soundtrack.wav"
+        log.info("Writing soundtrack: %s", soundtrack_path)
+        try:
+            # The old re-encode cut the audio at the end of the video; keep doing that
+            mix_soundtrack(cues, timeline.duration, soundtrack_path, engine=engine)
+
+            log.info("Muxing soundtrack into final video (video stream copied): %s", output_path)
+            _mux_audio(video_path, soundtrack_path, output_path, cancel)
+        finally:
+            soundtrack_path.unlink(missing_ok=True)
     else:
-        log.warning("No audio clips were added – final video will keep original audio (or silence).")
-
-    output_path = BASE_DIR.parent / "final_video.mp4"
-    log.info("Writing final video to: %s", output_path)
-    video.write_videofile(
-        str(output_path),
-        codec="libx264",
-        audio_codec="aac",
-        verbose=False,      # moviepy already logs; we use our own logger
-        logger=None
-    )
-    video.close()
+        log.warning("No sound cues were added – final video will keep original audio (or silence).")
+        log.info("Copying video to: %s", output_path)
+        shutil.copyfile(video_path, output_path)
 
     # ------------------------------------------------------------------
     # Cleanup
@@ -143,15 +111,28 @@ def add_sounds(filename: str) -> None:
         log.warning("Temporary video already gone: %s", video_path)
 
     log.info("add_sounds() finished successfully. Final video: %s", output_path)
+    return output_path
+
+
+# ----------------------------------------------------------------------
+def _mux_audio(video_path: Path, audio_path: Path, output_path: Path,
+               cancel: Optional[threading.Event] = None) -> None:
+    """Attaches ``audio_path`` to ``video_path`` without re-encoding the video stream."""
+    ffmpeg_args = [
+        "-i", video_path.resolve(), "-i", audio_path.resolve(),
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+        "-movflags", "+faststart", output_path.resolve()
+    ]
+    ffmpeg_runner.run(ffmpeg_args, "mux the soundtrack", cancel=cancel)
 
 
 # ----------------------------------------------------------------------
-def _add_audio_clip(sound_file: Path, clip_duration: float, clip_list: list, start_time: float) -> None:
-    """Helper that loads an audio file and appends it to the clip list."""
+def _add_audio_clip(sound_file: Path, clip_duration: float, cue_list: list, start_time: float) -> None:
+    """Helper that checks an audio file and appends its cue to the cue list."""
     if not sound_file.exists():
         log.error("Audio file missing: %s – skipping this clip", sound_file)
         return
 
-    log.debug("Loading audio: %s (duration %.2fs) → start %.2fs", sound_file.name, clip_duration, start_time)
-    audio_clip = AudioFileClip(str(sound_file)).set_start(start_time)
-    clip_list.append(audio_clip)
\ No newline at end of file
+    log.debug("Cue: %s (duration %.2fs) → start %.2fs", sound_file.name, clip_duration, start_time)
+    cue_list.append(Cue(sound_file, start_time))
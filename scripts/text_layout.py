@@ -0,0 +1,36 @@
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+LAYOUT_CACHE_SIZE = 8192
+
+
+class GlyphRun(NamedTuple):
+    """Measurements of a run of text drawn in a single font."""
+    bbox: Tuple[int, int, int, int]
+    width: int  # ink width, bbox[2] - bbox[0]
+
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def measure(font, text) -> GlyphRun:
+    """
+    Measures ``text`` in ``font``. Results are memoized per (font, text), so names,
+    mentions and repeated phrases are only laid out once per process.
+    """
+    bbox = font.getbbox(text)
+    return GlyphRun(bbox, bbox[2] - bbox[0])
+
+
+@lru_cache(maxsize=64)
+def metrics(font) -> Tuple[int, int]:
+    """Memoized ``font.getmetrics()``, i.e. (ascent, descent)."""
+    return font.getmetrics()
+
+
+def cache_info():
+    """Hit/miss statistics of the layout cache."""
+    return measure.cache_info()
+
+
+def clear_cache():
+    measure.cache_clear()
+    metrics.cache_clear()
@@ -0,0 +1,254 @@
+"""
+Opt-in tracing of the render pipeline: timed spans and cache hit/miss
+counters, written as a Chrome trace (open it in https://ui.perfetto.dev or
+chrome://tracing), with optional cProfile and tracemalloc dumps.
+
+    tracing.start("trace.json", profile="render.prof", memory="memory.txt")
+    with tracing.span("parse"):
+        ...
+    tracing.count("avatar.hit")
+    tracing.stop()
+
+Until :func:`start` is called every hook is a no-op, so they stay in the code.
+Frame rendering workers record their own spans (see :func:`settings`); they
+are merged into the trace when it is written.
+"""
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# True while a trace is being recorded (in this process)
+ENABLED = False
+# Allocation sites listed in the tracemalloc dump
+MEMORY_TOP = 40
+
+_lock = threading.Lock()
+_events = []
+_counters = {}
+_local = threading.local()
+_session = None     # trace, profile and memory paths, spool dir and profiler of start()
+_spool_dir = None   # where worker processes leave their events
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def now():
+    """Trace timestamp in microseconds (comparable across processes)."""
+    return time.perf_counter_ns() // 1000
+
+
+def _event(event):
+    event.setdefault("pid", os.getpid())
+    event.setdefault("tid", threading.get_ident())
+    with _lock:
+        _events.append(event)
+
+
+# ----------------------------------------------------------------------
+# Hooks
+# ----------------------------------------------------------------------
+class _Span:
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = now()
+        _local.depth = getattr(_local, "depth", 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        complete(self.name, self.start, self.category, **self.args)
+        _local.depth -= 1
+        if _local.depth == 0 and _spool_dir is not None:
+            _flush_worker()
+        return False
+
+
+def span(name, category="render", **args):
+    """Context manager recording the time spent in its body as a span called ``name``."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def traced(name=None, category="render"):
+    """Decorator recording every call of a function as a span."""
+    def decorator(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with _Span(label, category, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def complete(name, start, category="render", **args):
+    """Records a span called ``name`` from ``start`` (see :func:`now`) until now."""
+    if not ENABLED:
+        return
+    end = now()
+    _event({"name": name, "cat": category, "ph": "X", "ts": start, "dur": end - start,
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in args.items()}})
+
+
+def count(name, n=1):
+    """Adds ``n`` to the counter ``name`` (e.g. ``"avatar.hit"``)."""
+    if not ENABLED:
+        return
+    with _lock:
+        value = _counters[name] = _counters.get(name, 0) + n
+    _event({"name": name, "cat": "counter", "ph": "C", "ts": now(), "args": {"value": value}})
+
+
+def count_lookup(name, hit):
+    """Counts a cache lookup as ``<name>.hit`` or ``<name>.miss``."""
+    if ENABLED:
+        count(f"{name}.hit" if hit else f"{name}.miss")
+
+
+def counters():
+    """Counter totals of this process."""
+    with _lock:
+        return dict(_counters)
+
+
+# ----------------------------------------------------------------------
+# Worker processes
+# ----------------------------------------------------------------------
+def settings():
+    """Settings for :func:`configure` in a worker process (spawned workers start fresh)."""
+    return {"spool_dir": _session["spool_dir"] if ENABLED else None}
+
+
+def configure(spool_dir=None):
+    """Records spans in a worker process; they are appended to a file in ``spool_dir``."""
+    global ENABLED, _spool_dir
+    _spool_dir = Path(spool_dir) if spool_dir is not None else None
+    ENABLED = _spool_dir is not None
+    if ENABLED:
+        _event({"name": "process_name", "ph": "M", "args": {"name": f"render worker {os.getpid()}"}})
+        atexit.register(_flush_worker)
+
+
+def _flush_worker():
+    with _lock:
+        events = list(_events)
+        _events.clear()
+    if not events:
+        return
+    with open(_spool_dir / f"{os.getpid()}.jsonl", "a", encoding="utf8") as f:
+        f.writelines(json.dumps(event) + "\n" for event in events)
+
+
+def _spooled_events(spool_dir):
+    events = []
+    for path in sorted(Path(spool_dir).glob("*.jsonl")):
+        with open(path, encoding="utf8") as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+    return events
+
+
+# ----------------------------------------------------------------------
+# Sessions
+# ----------------------------------------------------------------------
+def start(trace=None, profile=None, memory=None):
+    """
+    Starts recording spans and counters for ``trace`` (a .json path). With
+    ``profile``, the calling thread also runs under cProfile (its stats go to
+    that path, for ``python -m pstats`` or snakeviz); with ``memory``,
+    tracemalloc follows allocations and the largest sites are written there.
+    """
+    global ENABLED, _session
+    if _session is not None:
+        raise RuntimeError("A trace is already being recorded")
+    _session = {"trace": trace, "profile": profile, "memory": memory, "profiler": None,
+                "spool_dir": tempfile.mkdtemp(prefix="beluga-trace-")}
+    with _lock:
+        _events.clear()
+        _counters.clear()
+    ENABLED = trace is not None
+    _event({"name": "process_name", "ph": "M", "args": {"name": "beluga"}})
+    if memory is not None:
+        tracemalloc.start()
+    if profile is not None:
+        _session["profiler"] = cProfile.Profile()
+        _session["profiler"].enable()
+
+
+def stop():
+    """Stops recording and writes the trace, profile and memory dumps asked for in :func:`start`."""
+    global ENABLED, _session
+    if _session is None:
+        return
+    session, _session = _session, None
+    ENABLED = False
+
+    if session["profiler"] is not None:
+        session["profiler"].disable()
+        _write(session["profile"], session["profiler"].dump_stats)
+        log.info("Profile written to %s", session["profile"])
+
+    if session["memory"] is not None:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lines = [f"Traced memory: {current / 1e6:.1f} MB now, {peak / 1e6:.1f} MB at peak", ""]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:MEMORY_TOP]]
+        _write(session["memory"], lambda path: Path(path).write_text("\n".join(lines) + "\n", encoding="utf8"))
+        log.info("Memory statistics written to %s", session["memory"])
+
+    if session["trace"] is not None:
+        with _lock:
+            events = list(_events) + _spooled_events(session["spool_dir"])
+            totals = dict(_counters)
+        # Worker counters are per process: add up the last value of each
+        last = {}
+        for event in events:
+            if event.get("ph") == "C" and event["pid"] != os.getpid():
+                last[(event["pid"], event["name"])] = event["args"]["value"]
+        for (_, name), value in last.items():
+            totals[name] = totals.get(name, 0) + value
+        trace = {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"counters": totals}}
+        _write(session["trace"], lambda path: Path(path).write_text(json.dumps(trace), encoding="utf8"))
+        log.info("Trace written to %s (%d events)", session["trace"], len(events))
+    with _lock:
+        _events.clear()
+        _counters.clear()
+    shutil.rmtree(session["spool_dir"], ignore_errors=True)
+
+
+def _write(path, writer):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    writer(str(path))
+
+
+@contextlib.contextmanager
+def session(trace=None, profile=None, memory=None):
+    """:func:`start` … :func:`stop` around a block; does nothing when no output is asked for."""
+    if trace is None and profile is None and memory is None:
+        yield
+        return
+    start(trace, profile, memory)
+    try:
+        yield
+    finally:
+        stop()
@@ -0,0 +1,25 @@
+import numpy as np
+
+from audio_engine import LIMITER_THRESHOLD, limit
+
+
+def test_quiet_mix_passes_untouched():
+    mix = np.array([[0.0, 0.5], [-0.5, LIMITER_THRESHOLD]], dtype=np.float32)
+    assert limit(mix) is mix
+
+
+def test_loud_samples_stay_below_full_scale():
+    mix = np.array([[0.95, -0.95], [2.0, -2.0], [40.0, -40.0]], dtype=np.float32)
+    limited = limit(mix)
+    assert np.all(np.abs(limited) > LIMITER_THRESHOLD)
+    assert np.all(np.abs(limited) <= 1.0)
+    assert np.array_equal(np.sign(limited), np.sign(mix))
+
+
+def test_limiter_keeps_the_order_of_loudness():
+    mix = np.linspace(-3.0, 3.0, 601, dtype=np.float32).reshape(-1, 1)
+    limited = limit(mix)
+    assert np.all(np.diff(limited[:, 0]) >= 0)
+    assert np.array_equal(limited[np.abs(mix) <= LIMITER_THRESHOLD], mix[np.abs(mix) <= LIMITER_THRESHOLD])
+    # The input is not modified in place
+    assert mix[-1, 0] == 3.0
@@ -0,0 +1,37 @@
+import pytest
+
+import emoji_store
+from beluga import RenderOptions, main, render
+from generate_chat import BASE_DIR
+from presets import get_preset
+
+EXAMPLE_SCRIPT = BASE_DIR / "assets" / "example" / "example_script.txt"
+
+
+@pytest.mark.parametrize("flag", ["--stream", "--segmented"])
+def test_vfr_with_a_constant_frame_rate_mode_is_rejected(flag, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(["render", str(EXAMPLE_SCRIPT), "--vfr", flag])
+    assert exit_info.value.code == 2
+    assert "--vfr cannot be combined" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("mode", ["stream", "segmented"])
+def test_render_refuses_a_vfr_preset_it_cannot_honour(mode, tmp_path):
+    options = RenderOptions(output=tmp_path / "out.mp4", preset=get_preset()._replace(vfr=True), **{mode: True})
+    with pytest.raises(ValueError, match="VFR"):
+        render(EXAMPLE_SCRIPT, options)
+    assert not (tmp_path / "out.mp4").exists()
+
+
+def test_validate_lists_the_emojis_missing_from_the_store(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(emoji_store, "EMOJI_DIR", tmp_path)
+    script = tmp_path / "script.txt"
+    script.write_text("Billy:\nhello 💀$^1\n", encoding="utf8")
+    main(["validate", str(script)])
+    out = capsys.readouterr().out
+    assert "💀" in out and "seed-emojis" in out
+
+    (tmp_path / emoji_store.emoji_filenames("💀")[0]).write_bytes(b"sprite")
+    main(["validate", str(script)])
+    assert "seed-emojis" not in capsys.readouterr().out
@@ -0,0 +1,18 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from benchmark import recorded_options  # noqa: E402
+from presets import PRESETS, get_preset  # noqa: E402
+
+
+def test_options_match_a_baseline_read_back_from_disk():
+    args = argparse.Namespace(workers=2, segmented=False, audio_engine="ffmpeg", scale=1.0, repeat=3)
+    for name in PRESETS:
+        options = recorded_options(args, get_preset(name))
+        baseline = json.loads(json.dumps({"options": options}, indent=2))
+        assert baseline["options"] == options
+        assert baseline["options"] == recorded_options(args, get_preset(name))
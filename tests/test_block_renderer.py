@@ -0,0 +1,75 @@
+import pytest
+from PIL import Image, ImageChops
+
+from characters import get_character
+from generate_chat import BASE_DIR, DEFAULT_LAYOUT, WORLD_COLOR, BlockRenderer, layout_for
+
+SPEAKER = "Billy"
+
+# A block long enough to scroll, with emoji-only rows, descenders, mentions and a wrapped line
+LONG_BLOCK = (
+    ["💀", "💀💀", "aaa", "bbb", "gjpqy descenders", "@Peanut where are you", "**bold** and __italic__ 🔥"]
+    + [f"line {i} with some words" for i in range(8, 36)]
+    + ["💀", "this one is long enough to wrap onto a second row " * 3, "💀", "gg", "last line yjq"]
+)
+
+LAYOUTS = {
+    "original": DEFAULT_LAYOUT,
+    "720p": layout_for((1280, 720)),
+    "vertical": layout_for((1080, 1920)),
+}
+
+
+def block_renderer(layout):
+    character = get_character(SPEAKER)
+    profpic_file = BASE_DIR / "assets" / "profile_pictures" / character["profile_pic"]
+    return BlockRenderer((SPEAKER, "1:05"), str(profpic_file), character["role_color"], layout)
+
+
+def ink_rows(image):
+    """Top and bottom (exclusive) of everything drawn on a block image."""
+    background = Image.new("RGB", image.size, WORLD_COLOR[:3])
+    bbox = ImageChops.difference(image.convert("RGB"), background).getbbox()
+    return (bbox[1], bbox[3]) if bbox else None
+
+
+@pytest.mark.parametrize("layout", LAYOUTS.values(), ids=LAYOUTS.keys())
+def test_newest_message_of_a_long_block_is_visible(layout):
+    renderer = block_renderer(layout)
+    # Room left below the top of the last row of a block
+    below_last_row = layout.block_height(0) - layout.message_position(0)[1]
+    for i, message in enumerate(LONG_BLOCK):
+        image = renderer.add_message(message)
+        rows = ink_rows(image)
+        assert rows is not None
+        # The newest row is drawn inside the block, not below it
+        assert rows[1] > image.height - below_last_row, f"message {i} ({message!r}) is below the block"
+        assert rows[1] < image.height - layout.px(10), f"message {i} ({message!r}) is cut off"
+    assert renderer.scroll > 0
+
+
+@pytest.mark.parametrize("layout", LAYOUTS.values(), ids=LAYOUTS.keys())
+def test_incremental_frames_match_a_full_redraw(layout):
+    renderer = block_renderer(layout)
+    for i, message in enumerate(LONG_BLOCK):
+        image = renderer.add_message(message)
+        full = block_renderer(layout)
+        full.resume(LONG_BLOCK[:i + 1], load_frame=None)
+        expected = full.redraw()
+        assert image.size == expected.size
+        assert ImageChops.difference(image.convert("RGB"), expected.convert("RGB")).getbbox() is None, f"frame of message {i} ({message!r}) differs"
+
+
+@pytest.mark.parametrize("layout", LAYOUTS.values(), ids=LAYOUTS.keys())
+def test_resumed_block_matches_a_full_redraw(layout):
+    renderer = block_renderer(layout)
+    previous = None
+    for i, message in enumerate(LONG_BLOCK):
+        resumed = block_renderer(layout)
+        if previous is not None:
+            frame = layout.compose(previous)
+            resumed.resume(LONG_BLOCK[:i], load_frame=lambda: frame)
+        image = resumed.add_message(message)
+        expected = renderer.add_message(message)
+        assert ImageChops.difference(image.convert("RGB"), expected.convert("RGB")).getbbox() is None, f"frame of message {i} ({message!r}) differs"
+        previous = expected
@@ -0,0 +1,44 @@
+import logging
+import os
+
+import pytest
+
+import emoji_store
+
+
+@pytest.fixture
+def empty_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(emoji_store, "EMOJI_DIR", tmp_path)
+    monkeypatch.setattr(emoji_store, "_seed_hint_logged", False)
+    emoji_store.clear_cache()
+    yield tmp_path
+    emoji_store.clear_cache()
+
+
+def test_first_missing_sprite_says_how_to_seed_the_store(empty_store, caplog):
+    with caplog.at_level(logging.WARNING, logger=emoji_store.__name__):
+        emoji_store.EMOJI_SOURCE.get_emoji("💀")
+        emoji_store.EMOJI_SOURCE.get_emoji("🔥")
+    hints = [record for record in caplog.records if "seed-emojis" in record.getMessage()]
+    assert len(hints) == 1
+
+
+def test_sprite_in_the_store_is_used_quietly(empty_store, caplog):
+    sprite = empty_store / emoji_store.emoji_filenames("💀")[0]
+    sprite.write_bytes(b"sprite")
+    with caplog.at_level(logging.WARNING, logger=emoji_store.__name__):
+        assert emoji_store.EMOJI_SOURCE.get_emoji("💀").getvalue() == b"sprite"
+    assert not caplog.records
+
+
+def test_sprite_seeded_while_running_replaces_the_fallback(empty_store):
+    fallback = emoji_store.load_emoji("💀")
+    sprite = empty_store / emoji_store.emoji_filenames("💀")[0]
+    sprite.write_bytes(b"seeded")
+    assert emoji_store.load_emoji("💀") == b"seeded"
+
+    sprite.write_bytes(b"replaced")
+    os.utime(sprite, ns=(sprite.stat().st_atime_ns, sprite.stat().st_mtime_ns + 1_000_000_000))
+    assert emoji_store.load_emoji("💀") == b"replaced"
+    sprite.unlink()
+    assert emoji_store.load_emoji("💀") == fallback
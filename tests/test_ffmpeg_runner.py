@@ -0,0 +1,98 @@
+import io
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import ffmpeg_runner
+from ffmpeg_runner import FFmpegCancelled, FFmpegError, FFmpegProcess, Progress
+
+PROGRESS_OUTPUT = b"""frame=12
+fps=24.0
+out_time_us=500000
+out_time=00:00:00.500000
+progress=continue
+frame=48
+out_time_us=N/A
+progress=continue
+frame=96
+out_time_us=4000000
+progress=end
+"""
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which(ffmpeg_runner.FFMPEG) is None, reason="ffmpeg is not installed")
+
+
+def read_progress(output, duration=None):
+    reports = []
+    process = FFmpegProcess([], duration=duration, on_progress=reports.append)
+    process._process = SimpleNamespace(stdout=io.BytesIO(output))
+    process._started = time.monotonic()
+    process._read_progress()
+    return reports, process._last_progress
+
+
+def test_progress_blocks_are_parsed():
+    reports, last = read_progress(PROGRESS_OUTPUT, duration=4.0)
+    assert [(p.frame, p.seconds) for p in reports] == [(12, 0.5), (48, 0.0)]
+    # The final block is kept for the report of wait(), not sent twice
+    assert (last.frame, last.seconds) == (96, 4.0)
+    assert all(p.duration == 4.0 and not p.done for p in reports)
+
+
+def test_fraction_and_eta():
+    progress = Progress("encode", frame=0, seconds=1.0, duration=4.0, elapsed=3.0)
+    assert progress.fraction == 0.25
+    assert progress.eta == pytest.approx(9.0)
+    assert progress._replace(seconds=0.0).eta is None
+    assert progress._replace(seconds=9.0).fraction == 1.0
+    assert progress._replace(duration=None).fraction is None
+    assert progress._replace(duration=None).eta is None
+    assert progress._replace(duration=None, done=True).fraction == 1.0
+
+
+@needs_ffmpeg
+def test_run_reports_progress_until_done(tmp_path):
+    reports = []
+    ffmpeg_runner.run(["-f", "lavfi", "-i", "color=size=32x32:duration=1:rate=10", "-f", "null", "-"],
+                      description="test", duration=1.0, on_progress=reports.append)
+    assert reports and reports[-1].done
+    assert reports[-1].fraction == 1.0
+    assert sum(p.done for p in reports) == 1
+
+
+@needs_ffmpeg
+def test_failure_raises_with_ffmpeg_output(tmp_path):
+    with pytest.raises(FFmpegError) as raised:
+        ffmpeg_runner.run(["-i", str(tmp_path / "missing.mp4"), str(tmp_path / "out.mp4")], description="convert")
+    assert raised.value.returncode != 0
+    assert "missing.mp4" in raised.value.stderr
+    assert str(raised.value).startswith("ffmpeg could not convert")
+
+
+@needs_ffmpeg
+def test_cancel_stops_ffmpeg():
+    cancel = threading.Event()
+    process = ffmpeg_runner.pipe(["-f", "rawvideo", "-s", "2x2", "-pix_fmt", "rgb24", "-i", "-", "-f", "null", "-"],
+                                 cancel=cancel).start()
+    process.write(b"\0" * 12)
+    cancel.set()
+    with pytest.raises(FFmpegCancelled):
+        process.write(b"\0" * 12)
+    process.kill()
+
+
+@pytest.mark.parametrize("output, expected", [
+    ("ffmpeg version 4.4.2-0ubuntu0.22.04.1 Copyright (c) 2000-2021", (4, 4)),
+    ("ffmpeg version n6.1.1 Copyright (c) 2000-2023", (6, 1)),
+    ("ffmpeg version N-112345-gabcdef Copyright (c) 2000-2024", None),
+])
+def test_version_is_read_from_ffmpeg(output, expected, monkeypatch):
+    monkeypatch.setattr(ffmpeg_runner.subprocess, "run", lambda *args, **kwargs: SimpleNamespace(stdout=output))
+    ffmpeg_runner.version.cache_clear()
+    try:
+        assert ffmpeg_runner.version() == expected
+    finally:
+        ffmpeg_runner.version.cache_clear()
@@ -0,0 +1,110 @@
+import datetime
+import os
+import random
+import time
+
+import pytest
+
+import frame_cache
+from generate_chat import plan_frames, render_frames, save_images
+from script_compiler import compile_script
+
+
+def write(path, size, age):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_cache, "FRAME_CACHE_DIR", tmp_path)
+    return tmp_path
+
+
+def test_prune_keeps_the_most_recently_used_files(cache_dir):
+    old = write(cache_dir / "aa" / "old.png", 100, age=300)
+    middle = write(cache_dir / "bb" / "middle.png", 100, age=200)
+    new = write(cache_dir / "cc" / "new.png", 100, age=100)
+
+    assert frame_cache.prune(max_bytes=250, max_age=3600) == 100
+    assert not old.exists()
+    assert middle.exists() and new.exists()
+
+
+def test_prune_drops_files_unused_for_too_long(cache_dir):
+    stale = write(cache_dir / "aa" / "stale.png", 10, age=7200)
+    fresh = write(cache_dir / "aa" / "fresh.png", 10, age=10)
+
+    frame_cache.prune(max_bytes=10 ** 6, max_age=3600)
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_prune_leaves_files_being_written_alone(cache_dir):
+    partial = write(cache_dir / "aa" / ".key.123.456.tmp.png", 100, age=7200)
+    frame_cache.prune(max_bytes=0, max_age=0)
+    assert partial.exists()
+
+
+def test_lookup_marks_a_frame_as_used(cache_dir):
+    key = "ab" * 32
+    path = write(cache_dir / key[:2] / f"{key}.png", 10, age=7200)
+    assert frame_cache.lookup(key) == path
+    frame_cache.prune(max_bytes=10 ** 6, max_age=3600)
+    assert path.exists()
+
+
+def test_failed_store_leaves_no_temporary_file(cache_dir):
+    class Unsaveable:
+        def save(self, path, format=None):
+            open(path, "wb").close()
+            raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        frame_cache.store("cd" * 32, Unsaveable())
+    assert list(cache_dir.rglob("*")) == [cache_dir / "cd"]
+
+
+def test_frame_pruned_after_its_lookup_is_drawn_again(cache_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_cache, "PERSIST_FRAMES", True)
+    script = ["WELCOME Billy$^1", "", "Billy:", "hello$^1", "again$^1"]
+    specs = plan_frames(compile_script(script), datetime.datetime(2024, 1, 1, 13, 5), rng=random.Random(1))
+    first, second = tmp_path / "out" / "first", tmp_path / "out" / "second"
+    first.mkdir(parents=True)
+    second.mkdir()
+    render_frames(specs, first)
+
+    lookup = frame_cache.lookup
+
+    def lookup_then_prune(key):
+        path = lookup(key)
+        if path is not None:
+            path.unlink()
+        return path
+
+    monkeypatch.setattr(frame_cache, "lookup", lookup_then_prune)
+    render_frames(specs, second)
+    for path in sorted(first.iterdir()):
+        assert (second / path.name).read_bytes() == path.read_bytes()
+
+
+def test_cached_blocks_are_looked_up_once_per_frame(cache_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_cache, "PERSIST_FRAMES", True)
+    script = ["WELCOME Billy$^1", "", "Billy:", "hello$^1", "again$^1", "", "Peanut:", "hi$^1"]
+    start = datetime.datetime(2024, 1, 1, 13, 5)
+    save_images(script, start, seed=1, chat_dir=tmp_path / "first")
+
+    lookups = []
+    lookup = frame_cache.lookup
+
+    def counted_lookup(key):
+        lookups.append(key)
+        return lookup(key)
+
+    monkeypatch.setattr(frame_cache, "lookup", counted_lookup)
+    # Every block is cached, so no worker process is started
+    save_images(script, start, workers=2, seed=1, chat_dir=tmp_path / "second")
+    assert len(lookups) == len(set(lookups)) == len(list((tmp_path / "second").iterdir()))
@@ -0,0 +1,73 @@
+import datetime
+import os
+import random
+
+import pytest
+from PIL import Image, ImageChops
+
+import emoji_store
+import frame_cache
+from generate_chat import frame_key, layout_for, plan_frames, render_images
+from script_compiler import compile_script
+
+SCRIPT = [
+    "WELCOME Billy$^1",
+    "",
+    "Billy:",
+    "hello$^1",
+    "💀$^1",
+]
+START = datetime.datetime(2024, 1, 1, 13, 5)
+
+
+def specs(lines=SCRIPT, seed=1):
+    return plan_frames(compile_script(lines), START, rng=random.Random(seed))
+
+
+@pytest.fixture
+def emoji_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(emoji_store, "EMOJI_DIR", tmp_path)
+    return tmp_path
+
+
+def test_key_is_stable(emoji_dir):
+    first = [frame_key(spec) for spec in specs()]
+    assert first == [frame_key(spec) for spec in specs()]
+    assert len(set(first)) == len(first)
+
+
+def test_key_depends_on_text_seed_and_layout(emoji_dir):
+    joined, hello, skull = specs()
+    edited = specs(SCRIPT[:3] + ["hello!$^1", "💀$^1"])
+    assert frame_key(edited[1]) != frame_key(hello)
+    assert frame_key(edited[0]) == frame_key(joined)
+    assert frame_key(specs(seed=2)[0]) != frame_key(joined)
+    assert frame_key(hello, layout_for((1280, 720))) != frame_key(hello)
+
+
+def test_key_changes_with_the_emoji_sprites(emoji_dir):
+    _, hello, skull = specs()
+    keys = frame_key(hello), frame_key(skull)
+
+    sprite = emoji_dir / emoji_store.emoji_filenames("💀")[0]
+    sprite.write_bytes(b"first sprite")
+    with_sprite = frame_key(skull)
+    assert with_sprite != keys[1]
+    assert frame_key(hello) == keys[0]
+
+    sprite.write_bytes(b"another sprite")
+    os.utime(sprite, ns=(sprite.stat().st_atime_ns, sprite.stat().st_mtime_ns + 1_000_000_000))
+    assert frame_key(skull) != with_sprite
+
+
+def test_frame_is_redrawn_once_a_sprite_is_seeded(emoji_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(frame_cache, "PERSIST_FRAMES", True)
+    monkeypatch.setattr(frame_cache, "FRAME_CACHE_DIR", tmp_path / "frames")
+    skull = specs()[2]
+    layout = layout_for((640, 360))
+    before, = render_images([skull], layout)
+
+    Image.new("RGBA", (72, 72), (255, 0, 0, 255)).save(emoji_dir / emoji_store.emoji_filenames("💀")[0])
+    after, = render_images([skull], layout)
+    assert ImageChops.difference(before.convert("RGB"), after.convert("RGB")).getbbox() is not None
+    assert (255, 0, 0) in {color for _, color in after.convert("RGB").getcolors(1 << 16)}
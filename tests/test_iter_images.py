@@ -0,0 +1,43 @@
+import datetime
+from concurrent.futures import Future
+
+import generate_chat
+from generate_chat import JOBS_AHEAD_PER_WORKER, iter_images
+
+# Eight joined rows and a message block between each pair: many small jobs
+SCRIPT = [line for i in range(8) for line in ("WELCOME Billy$^1", "", "Billy:", f"hello {i}$^1", "")]
+START = datetime.datetime(2024, 1, 1, 13, 5)
+
+
+class InlineExecutor:
+    """Stands in for the process pool: runs each job on submit and counts the jobs not yet consumed."""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_parallel_frames_are_rendered_a_few_jobs_ahead(monkeypatch):
+    executor = InlineExecutor()
+    monkeypatch.setattr(generate_chat, "_process_pool", lambda workers: executor)
+    serial = list(iter_images(SCRIPT, START, seed=1))
+
+    frames = iter_images(SCRIPT, START, workers=2, seed=1)
+    parallel = []
+    for image in frames:
+        # Jobs handed to the pool run at most this far ahead of the frames taken from it
+        assert executor.submitted <= len(parallel) + 1 + 2 * JOBS_AHEAD_PER_WORKER
+        parallel.append(image)
+    assert executor.submitted == 16
+    assert [image.tobytes() for image in parallel] == [image.tobytes() for image in serial]
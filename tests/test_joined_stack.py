@@ -0,0 +1,23 @@
+import datetime
+
+from PIL import ImageChops, ImageDraw
+
+import generate_chat
+from generate_chat import generate_joined_message_stack
+
+JOINED_AT = datetime.datetime(2024, 1, 1, 13, 5)
+ROWS = [
+    ("Billy", "CHARACTER joined the party.", 10, JOINED_AT),
+    ("Peanut", "CHARACTER is here.", 20, JOINED_AT),
+]
+
+
+def test_changing_a_returned_stack_does_not_change_the_next_one(monkeypatch):
+    monkeypatch.setattr(generate_chat, "_last_joined_stack", None)
+    first = generate_joined_message_stack(ROWS[:1], 1)
+    ImageDraw.Draw(first).rectangle((0, 0, first.width, first.height), fill=(255, 0, 0, 255))
+
+    grown = generate_joined_message_stack(ROWS, 1)
+    monkeypatch.setattr(generate_chat, "_last_joined_stack", None)
+    expected = generate_joined_message_stack(ROWS, 1)
+    assert ImageChops.difference(grown.convert("RGB"), expected.convert("RGB")).getbbox() is None
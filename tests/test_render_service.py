@@ -0,0 +1,42 @@
+import datetime
+from pathlib import Path
+
+import pytest
+
+from beluga import RenderOptions
+from render_service import job_options
+
+DEFAULTS = RenderOptions(workers=1, seed=7)
+
+
+def test_job_without_options_renders_into_its_directory(tmp_path):
+    options = job_options({"script": "chat.txt"}, tmp_path / "chat-1234", DEFAULTS)
+    assert options.output == tmp_path / "chat-1234" / "chat-1234.mp4"
+    assert options.work_dir == tmp_path / "chat-1234" / "work"
+    assert (options.workers, options.seed, options.start_time) == (1, 7, None)
+
+
+def test_spec_overrides_the_defaults(tmp_path):
+    spec = {"script": "chat.txt", "command": "submit", "output": "out/video.mp4", "seed": 3, "workers": 4,
+            "stream": True, "work_dir": str(tmp_path / "keep"), "start_time": "13:05"}
+    options = job_options(spec, tmp_path / "job", DEFAULTS)
+    assert options.output == Path("out/video.mp4")
+    assert options.work_dir == tmp_path / "keep"
+    assert (options.seed, options.workers, options.stream) == (3, 4, True)
+    assert options.start_time == datetime.datetime.combine(datetime.date.today(), datetime.time(13, 5))
+    assert DEFAULTS.seed == 7
+
+
+def test_datetime_start_time_is_kept(tmp_path):
+    start = datetime.datetime(2024, 1, 1, 9, 30)
+    assert job_options({}, tmp_path, DEFAULTS._replace(start_time=start)).start_time == start
+
+
+def test_unknown_options_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="colour, speed"):
+        job_options({"script": "chat.txt", "speed": 2, "colour": "red"}, tmp_path, DEFAULTS)
+
+
+def test_malformed_start_time_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        job_options({"start_time": "1pm"}, tmp_path, DEFAULTS)
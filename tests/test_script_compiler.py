@@ -0,0 +1,72 @@
+import re
+
+import pytest
+
+from script_compiler import JOINED, MESSAGE, ScriptError, compile_script, split_markers
+
+SCRIPT = [
+    "WELCOME Billy$^1",
+    "WELCOME Peanut$^0.5#!pop",
+    "",
+    "# a comment",
+    "Billy:",
+    "hello$^0.1",
+    "**world**$^0.2#!ding",
+    "",
+    "Peanut:",
+    "hi$^2",
+]
+
+
+def test_split_markers():
+    assert split_markers("hello$^1.5#!ding") == ("hello", "1.5", "ding")
+    assert split_markers("hello$^ 2 ") == ("hello", "2", None)
+    assert split_markers("hello") == ("hello", None, None)
+
+
+def test_frames_of_a_script():
+    frames = compile_script(SCRIPT).frames
+    assert [(f.kind, f.speaker, f.runs, f.block_start) for f in frames] == [
+        (JOINED, "Billy", ("Billy",), 0),
+        (JOINED, "Peanut", ("Billy", "Peanut"), 0),
+        (MESSAGE, "Billy", ("hello",), 2),
+        (MESSAGE, "Billy", ("hello", "**world**"), 2),
+        (MESSAGE, "Peanut", ("hi",), 4),
+    ]
+    assert [f.sound for f in frames] == [None, "pop", None, "ding", None]
+    assert [f.line_no for f in frames] == [1, 2, 6, 7, 10]
+
+
+def test_durations_add_up_without_drift():
+    timeline = compile_script(["Billy:"] + ["x$^0.1"] * 1000 + ["last$^1"])
+    assert timeline.frames[-1].start == 100.0
+    assert timeline.duration == 101.0
+    assert [f.start for f in compile_script(SCRIPT).frames] == [0.0, 1.0, 1.5, 1.6, 1.8]
+
+
+def test_cues_are_the_frames_with_a_sound():
+    assert [f.index for f in compile_script(SCRIPT).cues] == [1, 3]
+
+
+@pytest.mark.parametrize("lines, line_no, message", [
+    (["Billy:", "hello"], 2, "Expected '$^'"),
+    (["Billy:", "hello$^"], 2, "Missing duration"),
+    (["Billy:", "hello$^soon"], 2, "Unable to convert"),
+    (["Billy:", "hello$^-1"], 2, "non-negative"),
+    (["Billy:", "hello$^NaN"], 2, "non-negative"),
+    (["WELCOME $^1"], 1, "Missing character name"),
+    (["Billy", "hello$^1"], 1, "Expected a name line"),
+    ([" : ", "hello$^1"], 1, "Name part before ':' is empty"),
+])
+def test_malformed_lines_raise(lines, line_no, message):
+    with pytest.raises(ScriptError, match=re.escape(message)) as raised:
+        compile_script(lines)
+    assert raised.value.line_no == line_no
+    assert str(raised.value).startswith(f"Line {line_no}: ")
+
+
+def test_errors_are_collected_when_asked():
+    errors = []
+    timeline = compile_script(["Billy:", "hello", "hi$^x", "ok$^1"], errors=errors)
+    assert [e.line_no for e in errors] == [2, 3]
+    assert [f.runs for f in timeline.frames] == [("ok",)]
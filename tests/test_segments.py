@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+import compile_images
+from compile_images import MIN_SEGMENT_SECONDS, frame_counts, plan_segments
+from script_compiler import compile_script
+
+
+def block(speaker, *durations):
+    return [f"{speaker}:"] + [f"line {i}$^{d}" for i, d in enumerate(durations)] + [""]
+
+
+def test_frame_counts_add_up_to_the_rounded_duration():
+    timeline = compile_script(block("Billy", *["0.13"] * 50))
+    counts = frame_counts(timeline, fps=30)
+    assert sum(counts) == round(timeline.duration * 30)
+    assert set(counts) == {3, 4}
+
+
+def test_frame_counts_follow_the_frame_rate():
+    timeline = compile_script(block("Billy", "1", "0.5", "0"))
+    assert frame_counts(timeline, fps=30) == [30, 15, 0]
+    assert frame_counts(timeline, fps=5) == [5, 3, 0]
+
+
+def test_segments_cover_the_timeline_in_order():
+    lines = block("Billy", "1", "0.5") + block("Peanut", "0.2") + block("Billy", "3") + block("Peanut", "1", "1")
+    timeline = compile_script(lines)
+    segments = plan_segments(timeline, fps=30)
+    assert [frame for segment in segments for frame, _ in segment] == list(timeline.frames)
+    assert [count for segment in segments for _, count in segment] == frame_counts(timeline, fps=30)
+
+
+def test_segments_start_at_blocks_and_are_long_enough():
+    lines = block("Billy", "1", "0.5") + block("Peanut", "0.2") + block("Billy", "3") + block("Peanut", "1", "1")
+    segments = plan_segments(compile_script(lines), fps=30)
+    assert [[frame.index for frame, _ in segment] for segment in segments] == [[0, 1, 2, 3], [4, 5]]
+    for segment in segments:
+        first = segment[0][0]
+        assert first.block_start == first.index
+    for segment in segments[:-1]:
+        assert sum(count for _, count in segment) >= MIN_SEGMENT_SECONDS * 30
+
+
+def test_long_block_stays_in_one_segment():
+    segments = plan_segments(compile_script(block("Billy", *["1"] * 10)), fps=30)
+    assert len(segments) == 1
+
+
+def test_failed_segment_stops_the_segments_being_encoded(tmp_path, monkeypatch):
+    timeline = compile_script(block("Billy", "2", "1") + block("Peanut", "2", "1"))
+    chat_dir = tmp_path / "chat"
+    chat_dir.mkdir()
+    for frame in timeline.frames:
+        (chat_dir / f"{frame.index + 1:03d}.png").write_bytes(bytes([frame.index]))
+    monkeypatch.setattr(compile_images, "SEGMENT_CACHE_DIR", tmp_path / "segments")
+    monkeypatch.setattr(compile_images.os, "cpu_count", lambda: 4)
+
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def encode_segment(entries, preset, segment_path, on_progress=None, cancel=None):
+        if entries[0][0].name == "001.png":
+            started.wait(5)
+            raise RuntimeError("segment failed")
+        started.set()
+        deadline = time.monotonic() + 5
+        while not cancel.is_set() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if cancel.is_set():
+            stopped.set()
+
+    monkeypatch.setattr(compile_images, "_encode_segment", encode_segment)
+    with pytest.raises(RuntimeError, match="segment failed"):
+        compile_images.encode_segmented(timeline, chat_dir, tmp_path / "out.mp4", tmp_path)
+    assert stopped.is_set()
@@ -0,0 +1,50 @@
+import pytest
+
+from generate_chat import DEFAULT_LAYOUT, MENTION_PADDING, fonts, message_runs, run_width, wrap_runs
+
+PADDING = DEFAULT_LAYOUT.px(MENTION_PADDING)
+WIDTH = DEFAULT_LAYOUT.message_width
+
+
+def rows_of(message, max_width=WIDTH):
+    return wrap_runs(message_runs(message, fonts()), max_width, PADDING)
+
+
+def row_width(row):
+    return sum(run_width(run, PADDING) for run in row[:-1]) + run_width(row[-1]._replace(text=row[-1].text.rstrip()), PADDING)
+
+
+def test_message_that_fits_keeps_its_runs():
+    runs = message_runs("hello **bold** and __italic__ @Peanut", fonts())
+    assert wrap_runs(runs, WIDTH, PADDING) == [runs]
+
+
+def test_long_message_wraps_between_words():
+    message = "the quick brown fox jumps over the lazy dog " * 6
+    rows = rows_of(message)
+    assert len(rows) > 1
+    assert all(row_width(row) <= WIDTH for row in rows)
+    assert "".join(run.text for row in rows for run in row).split() == message.split()
+    # Rows after the first do not start with the space they were broken at
+    assert all(not row[0].text.startswith(" ") for row in rows[1:])
+
+
+def test_runs_keep_their_fonts_across_rows():
+    message = "plain words " * 8 + "**" + "bold words " * 8 + "**"
+    font_set = fonts()
+    for row in rows_of(message, max_width=WIDTH // 3):
+        for run in row:
+            expected = font_set.message_bold if run.text.strip().startswith("bold") else font_set.message
+            assert run.font is expected
+
+
+def test_word_wider_than_a_row_gets_a_row_of_its_own():
+    rows = rows_of("short " + "x" * 200 + " short", max_width=200)
+    assert [row[0].text.strip() for row in rows] == ["short", "x" * 200, "short"]
+
+
+@pytest.mark.parametrize("max_width", [50, 150, 400])
+def test_mentions_never_break(max_width):
+    rows = rows_of("hey @Peanut and @Billy come over here", max_width=max_width)
+    mentions = [run.text for row in rows for run in row if run.mention]
+    assert mentions == ["@Peanut", "@Billy"]